@@ -1,4 +1,4 @@
-import openpyxl
+import os
 import re
 
 def count_syllables(word: str) -> int:
@@ -9,6 +9,8 @@ def count_syllables(word: str) -> int:
 
 def load_aoa_words(filepath="AoA_ratings_Kuperman_et_al_BRM.xlsx"):
     """Load all AoA words, filter for readability, and keep AoA value."""
+    import openpyxl
+
     wb = openpyxl.load_workbook(filepath)
     ws = wb.worksheets[0]
 
@@ -33,24 +35,24 @@ def load_aoa_words(filepath="AoA_ratings_Kuperman_et_al_BRM.xlsx"):
 
     return filtered
 
-def save_split_by_grade(words):
+def save_split_by_grade(words, out_dir="."):
     """Save words into 3 files by AoA: K, Grade 1, Grade 2."""
     k_words = [w for w, v in words if v < 5]
     g1_words = [w for w, v in words if 5 <= v < 6]
     g2_words = [w for w, v in words if 6 <= v < 7]
 
-    with open("kindergartenAOA.txt", "w", encoding="utf-8") as f:
+    with open(os.path.join(out_dir, "kindergartenAOA.txt"), "w", encoding="utf-8") as f:
         f.write("\n".join(k_words))
-    with open("grade1AOA.txt", "w", encoding="utf-8") as f:
+    with open(os.path.join(out_dir, "grade1AOA.txt"), "w", encoding="utf-8") as f:
         f.write("\n".join(g1_words))
-    with open("grade2AOA.txt", "w", encoding="utf-8") as f:
+    with open(os.path.join(out_dir, "grade2AOA.txt"), "w", encoding="utf-8") as f:
         f.write("\n".join(g2_words))
 
     print(f"Saved {len(k_words)} K words, {len(g1_words)} Grade 1 words, {len(g2_words)} Grade 2 words.")
 
-def main():
-    aoa_words = load_aoa_words()
-    save_split_by_grade(aoa_words)
+def main(filepath="AoA_ratings_Kuperman_et_al_BRM.xlsx", out_dir="."):
+    aoa_words = load_aoa_words(filepath)
+    save_split_by_grade(aoa_words, out_dir)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,5 +1,5 @@
-import openpyxl
-import pronouncing
+import json
+import os
 import string
 import re
 
@@ -87,17 +87,57 @@ def load_fry_words(filepath="Word Lists/1000words.txt", limit=100):
         words = [line.strip().lower() for line in f if line.strip()]
     return set(words[:limit])
 
+# --------------------------------------------------
+# Lesson sheet rows, cached next to the spreadsheet
+# --------------------------------------------------
+# Opening the workbook costs more than the rest of an analysis, so the
+# (rule, words) column pairs are kept in a JSON sidecar that is rebuilt
+# whenever the spreadsheet's size or mtime changes.
+_lesson_rows = {}
+
+def load_lesson_rows(filepath="phonics_lessons.xlsx"):
+    """(rule, words_raw) per row of the lesson sheet; index N is lesson N."""
+    stat = os.stat(filepath)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    cached = _lesson_rows.get(filepath)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    cache_path = os.path.splitext(filepath)[0] + ".words.json"
+    rows = None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("stamp") == stamp:
+            rows = data["rows"]
+    except (OSError, ValueError):
+        pass
+
+    if rows is None:
+        import openpyxl
+
+        ws = openpyxl.load_workbook(filepath, read_only=True).worksheets[1]
+        rows = [list(row[:2]) for row in ws.iter_rows(min_col=1, max_col=2, values_only=True)]
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"stamp": stamp, "rows": rows}, f)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass
+
+    _lesson_rows[filepath] = (stamp, rows)
+    return rows
+
 # --------------------------------------------------
 # Load review phonics words from spreadsheet
 # --------------------------------------------------
 def load_previous_phonics_words(filepath="phonics_lessons.xlsx", lesson_num=35):
-    wb = openpyxl.load_workbook(filepath)
-    ws = wb.worksheets[1]
+    rows = load_lesson_rows(filepath)
 
     review_words = set()
-    for ln in range(1, lesson_num):
-        row = ws[ln + 1]
-        words_raw = row[1].value
+    for ln in range(1, min(lesson_num, len(rows))):
+        words_raw = rows[ln][1]
         if words_raw:
             review_words.update(
                 w.strip().lower()
@@ -109,14 +149,57 @@ def load_previous_phonics_words(filepath="phonics_lessons.xlsx", lesson_num=35):
 # --------------------------------------------------
 # Check phonics via pronouncing
 # --------------------------------------------------
-def has_target_phonics(word, target_phonemes):
-    pronunciations = pronouncing.phones_for_word(word)
+def phones_for_words(words):
+    """CMUdict pronunciations for just `words`.
+
+    Scanning the dictionary for a story's words is several times faster
+    than pronouncing's full load; reuse that load if it already happened.
+    """
+    import pronouncing
+
+    words = set(words)
+    if pronouncing.lookup is not None:
+        return {w: pronouncing.phones_for_word(w) for w in words}
+
+    import cmudict
+
+    phones = {w: [] for w in words}
+    with cmudict.dict_stream() as f:
+        for line in f:
+            line = line.strip().decode("utf-8")
+            if line.startswith(";"):
+                continue
+            word, pron = line.split(" ", 1)
+            word = word.split("(", 1)[0].lower()
+            if word in phones:
+                phones[word].append(pron)
+    return phones
+
+def has_target_phonics(word, target_phonemes, phones=None):
+    if not target_phonemes:
+        return False
+    if phones is not None and word in phones:
+        pronunciations = phones[word]
+    else:
+        import pronouncing
+
+        pronunciations = pronouncing.phones_for_word(word)
     for pron in pronunciations:
         for ph in target_phonemes:
             if ph in pron:
                 return True
     return False
 
+# --------------------------------------------------
+# Classify one cleaned word
+# --------------------------------------------------
+def classify_word(word, fry_words, review_words, target_phonemes, phones=None):
+    if has_target_phonics(word, target_phonemes, phones):
+        return "target"
+    if word in fry_words or word in review_words:
+        return "known"
+    return "leftover"
+
 # --------------------------------------------------
 # Analyze pasted story
 # --------------------------------------------------
@@ -137,15 +220,17 @@ def analyze_story(story_text, lesson_num):
     )
 
     target_phonemes = LESSON_PHONEMES.get(lesson_num, [])
+    phones = phones_for_words(cleaned_words) if target_phonemes else None
 
     target_count = 0
     known_count = 0
     leftover_count = 0
 
     for word in cleaned_words:
-        if has_target_phonics(word, target_phonemes):
+        kind = classify_word(word, fry_words, review_words, target_phonemes, phones)
+        if kind == "target":
             target_count += 1
-        elif word in fry_words or word in review_words:
+        elif kind == "known":
             known_count += 1
         else:
             leftover_count += 1
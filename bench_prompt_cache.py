@@ -0,0 +1,135 @@
+"""Compare the old variable-first prompt layout with the stable-prefix layout.
+
+Runs the outline + story calls for every default lesson with each layout,
+streaming so time-to-first-token can be measured, and reports TTFT, prompt
+and cached tokens and estimated cost. Prompts are only cached past 1024
+tokens, so the savings come from lessons whose shared prefix (system prompt
+plus word lists) is over that: 48 and later, not 35 (~900 tokens).
+
+    python bench_prompt_cache.py                   # against the local fake server
+    python bench_prompt_cache.py --live            # against the real API (costs money)
+"""
+import argparse
+import os
+import statistics
+import time
+
+# USD per 1M tokens
+PRICES = {
+    "gpt-4o": {"input": 2.50, "cached": 1.25, "output": 10.00},
+}
+
+MODEL = "gpt-4o"
+
+
+def legacy_messages(context, task):
+    """The pre-restructure layout: per-lesson words first, static examples last."""
+    import unspecified_decodable
+
+    return [{"role": "user", "content": task + context + unspecified_decodable.SYSTEM_PROMPT}]
+
+
+def stream_call(client, messages):
+    start = time.perf_counter()
+    ttft = None
+    text = []
+    usage = None
+    stream = client.chat.completions.create(
+        model=MODEL, messages=messages, stream=True, stream_options={"include_usage": True},
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            text.append(chunk.choices[0].delta.content)
+        if chunk.usage:
+            usage = chunk.usage
+    return "".join(text), ttft or (time.perf_counter() - start), usage
+
+
+def run_layout(client, layout, lessons):
+    import llm_client
+    import unspecified_decodable as u
+
+    build = u.build_messages if layout == "stable" else legacy_messages
+    ttfts, prompt_tokens, cached_tokens, output_tokens = [], 0, 0, 0
+    for lesson_num in lessons:
+        fry_words = u.load_fry_words(limit=u.LESSON_FRY_LIMITS.get(lesson_num, 40))
+        review_words = u.load_previous_phonics_words("phonics_lessons.xlsx", lesson_num=lesson_num)
+        rule, target_words = u.load_phonics_lesson("phonics_lessons.xlsx", lesson_num=lesson_num)
+        grade, phase = u.LESSON_PHASE[lesson_num]
+        expectations = u.STORY_EXPECTATIONS[(grade, phase)]
+        context = u.lesson_context(
+            fry_words, review_words, target_words, lesson_num, grade, phase,
+            expectations["sentences"], expectations["target_repeats"],
+        )
+        outline, ttft, usage = stream_call(client, build(context, u.OUTLINE_TASK))
+        calls = [(ttft, usage)]
+        task = u.story_task(outline, grade, phase, expectations["sentences"], expectations["target_repeats"])
+        _, ttft, usage = stream_call(client, build(context, task))
+        calls.append((ttft, usage))
+
+        for ttft, usage in calls:
+            ttfts.append(ttft)
+            prompt, cached, output = llm_client.usage_counts(usage)
+            prompt_tokens += prompt
+            cached_tokens += cached
+            output_tokens += output
+
+    price = PRICES[MODEL]
+    cost = ((prompt_tokens - cached_tokens) * price["input"] + cached_tokens * price["cached"]
+            + output_tokens * price["output"]) / 1e6
+    return {
+        "layout": layout,
+        "ttft_mean": statistics.mean(ttfts),
+        "ttft_p50": statistics.median(ttfts),
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "cost": cost,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--live", action="store_true", help="use the real API instead of the fake server")
+    parser.add_argument("--lessons", type=int, nargs="+")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=150.0, help="fake server prefill cost")
+    args = parser.parse_args(argv)
+
+    import llm_client
+    import unspecified_decodable
+
+    lessons = args.lessons or unspecified_decodable.DEFAULT_LESSONS
+    server = None
+    if not args.live:
+        from fake_openai_server import FakeOpenAIServer
+
+        server = FakeOpenAIServer(("127.0.0.1", 0), latency="fixed:0.05", prefill_ms_per_1k=args.prefill_ms_per_1k)
+        server.start_background()
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+        os.environ["OPENAI_API_KEY"] = "test"
+    client = llm_client.get_client()
+
+    results = []
+    try:
+        for layout in ("legacy", "stable"):
+            if server:
+                server.prefix_cache.clear()
+            results.append(run_layout(client, layout, lessons))
+    finally:
+        if server:
+            server.shutdown()
+
+    print(f"\nPrompt layout benchmark, {len(lessons)} lessons\n" + "-" * 30)
+    for r in results:
+        print(
+            f"{r['layout']:>7}: TTFT mean {r['ttft_mean']:.3f}s p50 {r['ttft_p50']:.3f}s  "
+            f"prompt {r['prompt_tokens']} ({r['cached_tokens']} cached)  cost ${r['cost']:.4f}"
+        )
+    legacy, stable = results
+    print(f"TTFT reduction: {100 * (1 - stable['ttft_mean'] / legacy['ttft_mean']):.1f}%  "
+          f"cost reduction: {100 * (1 - stable['cost'] / legacy['cost']):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
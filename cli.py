@@ -0,0 +1,169 @@
+"""Single command-line entry point for the story scripts.
+
+    python cli.py generate decodable --lessons 35 48
+    python cli.py generate student
+    python cli.py analyze story.txt --lesson 35
+    python cli.py evaluate generated_book/story.txt --images generated_book/images
+    python cli.py build-lexicons
+
+Generation and evaluation split across machines with `--shard i/N`; once
+every shard has finished, `merge-shards` folds them into the usual layout:
+
+    python cli.py generate student --shard 0/4          # on each of 4 machines
+    python cli.py evaluate generated_books/*/story.txt --images images --shard 1/4
+    python cli.py merge-shards generated_student_stories evaluations
+
+Every script is imported inside its subcommand handler, so `analyze` never
+touches the OpenAI SDK and `--help` only pays for argparse.
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load_script(relpath, name):
+    """Import a script whose file name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relpath))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# --------------------------------------------------
+# Subcommand handlers
+# --------------------------------------------------
+def _shard_arg(spec):
+    import sharding
+
+    try:
+        return sharding.parse_shard(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def cmd_generate(args):
+    if args.kind == "decodable":
+        import unspecified_decodable
+
+        unspecified_decodable.main(lessons=args.lessons, shard=args.shard)
+    else:
+        import specified_story
+
+        specified_story.main(shard=args.shard)
+
+
+def cmd_analyze(args):
+    import analysis
+
+    with open(args.story, "r", encoding="utf-8") as f:
+        story = f.read()
+
+    if args.ture:
+        results = analysis.analyze_ture_story(story, args.lesson)
+    else:
+        results = analysis.analyze_story(story, args.lesson)
+
+    print(f"\nUFLI Lesson {args.lesson} Analysis\n" + "-" * 30)
+    for k, v in results.items():
+        if "pct" in k:
+            print(f"{k}: {v:.2f}%")
+        else:
+            print(f"{k}: {v}")
+
+
+def cmd_evaluate(args):
+    evaluator = _load_script("unspecified_eval_k-2.py", "unspecified_eval_k2")
+    evaluator.VERBOSE = not args.quiet
+
+    import llm_client
+
+    client = llm_client.get_client()
+
+    if len(args.story) == 1 and args.shard is None:
+        story = args.story[0]
+        if not args.images_only:
+            evaluator.eval_text(client, story)
+        if args.images and args.single_request:
+            evaluator.eval_images(client, story, args.images)
+        elif args.images:
+            evaluator.eval_pages(client, story, args.images)
+        return
+
+    # Several books or a shard: --images is relative to each story's folder
+    targets = [
+        (story, os.path.join(os.path.dirname(story), args.images) if args.images else None)
+        for story in args.story
+    ]
+    evaluator.eval_targets(
+        client, targets, shard=args.shard, text=not args.images_only, single_request=args.single_request
+    )
+
+
+def cmd_merge_shards(args):
+    import sharding
+
+    for output_dir in args.output_dirs:
+        merged = sharding.merge_shards(output_dir, allow_partial=args.allow_partial)
+        print(
+            f"{output_dir}: merged {len(merged['shards'])} shards, {len(merged['outputs'])} outputs"
+            + (f", missing shards {merged['missing']}" if merged["missing"] else "")
+        )
+
+
+def cmd_build_lexicons(args):
+    aoatest = _load_script(os.path.join("Word Lists", "aoatest.py"), "aoatest")
+    aoatest.main(filepath=args.ratings, out_dir=args.out_dir)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="generate stories with the OpenAI API")
+    gen.add_argument("kind", choices=["decodable", "student"])
+    gen.add_argument("--lessons", type=int, nargs="+", help="UFLI lessons (decodable only)")
+    gen.add_argument("--shard", metavar="i/N", type=_shard_arg, help="only run this machine's share of the jobs")
+    gen.set_defaults(func=cmd_generate)
+
+    ana = sub.add_parser("analyze", help="word-source breakdown of a story (offline)")
+    ana.add_argument("story", help="path to a story text file")
+    ana.add_argument("--lesson", type=int, required=True)
+    ana.add_argument("--ture", action="store_true", help="use the -ture/e-ending analysis")
+    ana.set_defaults(func=cmd_analyze)
+
+    ev = sub.add_parser("evaluate", help="rubric evaluation of story text and images")
+    ev.add_argument("story", nargs="+", help="path to story.txt, or several")
+    ev.add_argument("--images", help="directory of page images; relative to each story's folder with several stories or --shard")
+    ev.add_argument("--images-only", action="store_true")
+    ev.add_argument("--single-request", action="store_true",
+                    help="send the whole story and all images in one call instead of per page")
+    ev.add_argument("--quiet", action="store_true")
+    ev.add_argument("--shard", metavar="i/N", type=_shard_arg, help="only evaluate this machine's share of the stories")
+    ev.set_defaults(func=cmd_evaluate)
+
+    merge = sub.add_parser("merge-shards", help="fold per-shard outputs into the standard layout")
+    merge.add_argument("output_dirs", nargs="+", help="e.g. generated_student_stories evaluations")
+    merge.add_argument("--allow-partial", action="store_true", help="merge even if some shards are missing")
+    merge.set_defaults(func=cmd_merge_shards)
+
+    lex = sub.add_parser("build-lexicons", help="split AoA ratings into grade word lists")
+    lex.add_argument("--ratings", default=os.path.join("Word Lists", "AoA_ratings_Kuperman_et_al_BRM.xlsx"))
+    lex.add_argument("--out-dir", default="Word Lists")
+    lex.set_defaults(func=cmd_build_lexicons)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "generate" and args.kind == "student" and args.lessons:
+        parser.error("--lessons only applies to 'generate decodable'")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""Local stand-in for the OpenAI endpoints the story scripts use.
+
+Speaks enough of /v1/chat/completions (including streaming),
+/v1/responses, /v1/files and /v1/batches for the real SDK to talk to it,
+with configurable latency and 429/5xx injection. Prompt caching is
+simulated like the real service: prompts of 1024+ tokens are cached in
+128-token steps, reported as `cached_tokens`, and only uncached tokens pay
+the `--prefill-ms-per-1k` delay. Point a client at it with
+
+    OPENAI_BASE_URL=http://127.0.0.1:8808/v1 OPENAI_API_KEY=test
+
+    python fake_openai_server.py --latency lognormal:0.4,0.5 --rate-429 0.05
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8808
+
+# --------------------------------------------------
+# Canned payloads
+# --------------------------------------------------
+CANNED_OUTLINE = json.dumps([
+    "Pam has a big red van.",
+    "Pam and Sam make a plan.",
+    "They find a map with a flag.",
+    "They dig in the sand.",
+    "They are glad at the end.",
+])
+
+CANNED_STORY = """Pam has a big red van.
+Her pal Sam is in the van.
+Pam and Sam have a plan.
+They will go to the sand.
+Sam has a map.
+The map has a red flag on it.
+They get to the sand and dig.
+Pam and Sam are glad."""
+
+CANNED_PAGED_STORY = """**Page 1**
+Tam has a mat.
+
+---
+
+**Page 2**
+Tam and Gus go to the hut.
+
+---
+
+**Page 3**
+A big bug is on the mat.
+
+---
+
+**Page 4**
+Gus got the bug out.
+
+---
+
+**Page 5**
+Tam and Gus had fun."""
+
+TEXT_CATEGORIES = ["Phonics Integration", "Readability", "Simplicity & Structure", "Engagement", "Tone"]
+IMAGE_CATEGORIES = ["Alignment with Text", "Clarity", "Consistency", "Engagement", "Accessibility"]
+
+
+def canned_eval(categories):
+    rows = [
+        {"category": c, "score": "2", "justification": "Canned evaluation."}
+        for c in categories
+    ]
+    rows.append({"category": "Total Score", "score": str(2 * len(categories)), "justification": "Overall evaluation"})
+    return json.dumps(rows, indent=2)
+
+
+def canned_reply(prompt_text):
+    """Pick a payload that looks like what the calling script asked for."""
+    if "image" in prompt_text.lower() and "rubric" in prompt_text.lower():
+        return canned_eval(IMAGE_CATEGORIES)
+    if "rubric" in prompt_text.lower():
+        return canned_eval(TEXT_CATEGORIES)
+    if "rewritten sentences" in prompt_text:
+        # story_repair fallback: echo the sentences back unchanged
+        m = re.search(r"Sentences \(JSON array\): (\[.*\])", prompt_text)
+        return m.group(1) if m else "[]"
+    if "plot points" in prompt_text:
+        return CANNED_OUTLINE
+    if "'---'" in prompt_text or "pages" in prompt_text:
+        return CANNED_PAGED_STORY
+    return CANNED_STORY
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+# Same thresholds the real service uses for automatic prompt caching
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+
+
+def _flatten(content):
+    """Collapse chat/responses message content into plain text."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(_flatten(part) for part in content)
+    if isinstance(content, dict):
+        return content.get("text") or _flatten(content.get("content", ""))
+    return ""
+
+
+def prompt_text(payload):
+    """Serialize a chat or responses request body in prompt order."""
+    if "messages" in payload:
+        return "\n".join(_flatten(m.get("content")) for m in payload["messages"])
+    inputs = payload.get("input", "")
+    if isinstance(inputs, list):
+        body = "\n".join(_flatten(m.get("content")) for m in inputs)
+    else:
+        body = _flatten(inputs)
+    return _flatten(payload.get("instructions") or "") + "\n" + body
+
+
+# --------------------------------------------------
+# Latency distributions
+# --------------------------------------------------
+def parse_latency(spec):
+    """Return a zero-argument callable producing a delay in seconds.
+
+    Accepts `fixed:S`, `uniform:LO,HI` or `lognormal:MEDIAN,SIGMA`.
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(a) for a in args.split(",") if a]
+    if kind == "fixed":
+        return lambda: params[0]
+    if kind == "uniform":
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "lognormal":
+        mu = math.log(params[0])
+        return lambda: random.lognormvariate(mu, params[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+# --------------------------------------------------
+# Server
+# --------------------------------------------------
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency="fixed:0", rate_429=0.0, rate_5xx=0.0, retry_after=1.0,
+                 prefill_ms_per_1k=0.0, decode_ms_per_token=0.0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = parse_latency(latency)
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.decode_ms_per_token = decode_ms_per_token
+        self.prefix_cache = set()
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def record(self, path, status):
+        key = re.sub(r"/(file|batch)_[0-9a-f]+", r"/{\1}", path)
+        with self.lock:
+            per_path = self.stats.setdefault(key, {})
+            per_path[status] = per_path.get(status, 0) + 1
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {}
+
+    def cached_prefix_tokens(self, text):
+        """Longest previously seen cacheable prefix of `text`, in tokens."""
+        total = estimate_tokens(text)
+        steps = range(CACHE_MIN_TOKENS, total + 1, CACHE_STEP_TOKENS)
+        hashes = [(n, hash(text[:n * 4])) for n in steps]
+        with self.lock:
+            cached = max((n for n, h in hashes if h in self.prefix_cache), default=0)
+            self.prefix_cache.update(h for _, h in hashes)
+        return cached
+
+    def start_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # ---- plumbing ----
+    def _send(self, status, body, headers=None, content_type="application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.record(self.path, status)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _inject_failure(self):
+        roll = random.random()
+        if roll < self.server.rate_429:
+            self._send(
+                429,
+                {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+                headers={"Retry-After": str(self.server.retry_after)},
+            )
+            return True
+        if roll < self.server.rate_429 + self.server.rate_5xx:
+            self._send(503, {"error": {"message": "Service unavailable (fake)", "type": "server_error"}})
+            return True
+        return False
+
+    # ---- routing ----
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.server.lock:
+                snapshot = json.loads(json.dumps(self.server.stats))
+            return self._send(200, snapshot)
+        m = re.fullmatch(r"/v1/batches/(batch_[0-9a-f]+)", self.path)
+        if m and m.group(1) in self.server.batches:
+            return self._send(200, self.server.batches[m.group(1)])
+        m = re.fullmatch(r"/v1/files/(file_[0-9a-f]+)/content", self.path)
+        if m and m.group(1) in self.server.files:
+            return self._send(200, self.server.files[m.group(1)]["content"], content_type="application/jsonl")
+        self._send(404, {"error": {"message": f"No route for GET {self.path}"}})
+
+    def _send_stream(self, completion, include_usage):
+        """Replay a chat completion as server-sent chunks."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        base = {k: completion[k] for k in ("id", "created", "model")}
+        base["object"] = "chat.completion.chunk"
+        text = completion["choices"][0]["message"]["content"]
+        chunks = [{"role": "assistant", "content": ""}] + [{"content": piece} for piece in re.findall(r"\S+\s*", text)]
+        events = [{**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]} for delta in chunks]
+        events.append({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if include_usage:
+            events.append({**base, "choices": [], "usage": completion["usage"]})
+        for event in events:
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.server.decode_ms_per_token / 1000)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.server.record(self.path, 200)
+
+    def do_POST(self):
+        body = self._read_body()
+        time.sleep(self.server.latency())
+        if self.path in ("/v1/chat/completions", "/v1/responses") and self._inject_failure():
+            return
+        if self.path in ("/v1/chat/completions", "/v1/responses"):
+            payload = json.loads(body)
+            text = prompt_text(payload)
+            cached = self.server.cached_prefix_tokens(text)
+            # Prefill cost only applies to the uncached part of the prompt
+            time.sleep(self.server.prefill_ms_per_1k * (estimate_tokens(text) - cached) / 1e6)
+        if self.path == "/v1/chat/completions":
+            completion = chat_completion(payload, cached)
+            if payload.get("stream"):
+                return self._send_stream(completion, (payload.get("stream_options") or {}).get("include_usage"))
+            return self._send(200, completion)
+        if self.path == "/v1/responses":
+            return self._send(200, response_object(payload, cached))
+        if self.path == "/v1/files":
+            return self._send(200, self.create_file(body))
+        if self.path == "/v1/batches":
+            return self._send(200, self.create_batch(json.loads(body)))
+        self._send(404, {"error": {"message": f"No route for POST {self.path}"}})
+
+    # ---- files and batches ----
+    def create_file(self, body):
+        file_id = f"file_{uuid.uuid4().hex[:24]}"
+        lines = [ln for ln in body.decode("utf-8", "replace").splitlines() if ln.startswith("{")]
+        self.server.files[file_id] = {"content": "\n".join(lines).encode("utf-8"), "lines": lines}
+        return {
+            "id": file_id, "object": "file", "bytes": len(body), "created_at": int(time.time()),
+            "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+        }
+
+    def create_batch(self, payload):
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        endpoint = payload.get("endpoint", "/v1/chat/completions")
+        results = []
+        for line in self.server.files.get(payload.get("input_file_id"), {}).get("lines", []):
+            req = json.loads(line)
+            make = response_object if endpoint == "/v1/responses" else chat_completion
+            results.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": req.get("custom_id"),
+                "response": {"status_code": 200, "body": make(req.get("body", {}))},
+                "error": None,
+            }))
+        output_id = f"file_{uuid.uuid4().hex[:24]}"
+        self.server.files[output_id] = {"content": "\n".join(results).encode("utf-8"), "lines": results}
+        now = int(time.time())
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": endpoint,
+            "input_file_id": payload.get("input_file_id"),
+            "completion_window": payload.get("completion_window", "24h"),
+            "status": "completed", "output_file_id": output_id, "error_file_id": None,
+            "created_at": now, "completed_at": now,
+            "request_counts": {"total": len(results), "completed": len(results), "failed": 0},
+        }
+        self.server.batches[batch_id] = batch
+        return batch
+
+
+def chat_completion(payload, cached_tokens=0):
+    prompt = prompt_text(payload)
+    text = canned_reply(prompt)
+    prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": payload.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+
+
+def response_object(payload, cached_tokens=0):
+    prompt = prompt_text(payload)
+    text = canned_reply(prompt)
+    input_tokens, output_tokens = estimate_tokens(prompt), estimate_tokens(text)
+    return {
+        "id": f"resp_{uuid.uuid4().hex[:24]}",
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": payload.get("model", "gpt-4o-mini"),
+        "status": "completed",
+        "output": [{
+            "type": "message",
+            "id": f"msg_{uuid.uuid4().hex[:24]}",
+            "status": "completed",
+            "role": "assistant",
+            "content": [{"type": "output_text", "text": text, "annotations": []}],
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_tokens_details": {"cached_tokens": cached_tokens},
+            "output_tokens_details": {"reasoning_tokens": 0},
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S | uniform:LO,HI | lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of calls answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="fraction of calls answered with 503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0, help="delay per 1k uncached prompt tokens")
+    parser.add_argument("--decode-ms-per-token", type=float, default=0.0, help="delay between streamed chunks")
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(
+        (args.host, args.port), latency=args.latency,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, retry_after=args.retry_after,
+        prefill_ms_per_1k=args.prefill_ms_per_1k, decode_ms_per_token=args.decode_ms_per_token,
+    )
+    print(f"Fake OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Shared, rate-limit-aware OpenAI client for the generation and eval scripts.
+
+All scripts go through `chat_completion` / `create_response`, which share
+one OpenAI client (and so one pooled HTTP connection set) and, per model:
+
+- a token bucket on requests/minute and one on estimated tokens/minute
+- an AIMD concurrency limit that halves on 429s (at most once per
+  THROTTLE_COOLDOWN) and creeps back up
+- retries that honour `Retry-After` / `retry-after-ms` before falling
+  back to jittered exponential backoff; a Retry-After pauses every call
+  to that model, not just the one that got it
+
+Per-model limits come from model_limits.json (override the path with
+MODEL_LIMITS_PATH). Prompt and cached-prompt token counts from every
+response are accumulated in `stats()` and printed per call when VERBOSE.
+"""
+import json
+import os
+import random
+import threading
+import time
+
+LIMITS_PATH = os.environ.get(
+    "MODEL_LIMITS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_limits.json"),
+)
+
+DEFAULT_LIMITS = {"rpm": 500, "tpm": 30000, "max_concurrency": 8, "max_retries": 6}
+
+# Expected completion size used when reserving tokens before a call
+EST_OUTPUT_TOKENS = 512
+
+MAX_BACKOFF = 60.0
+
+# A burst of 429s from calls already in flight is one throttling event:
+# the concurrency limit is halved at most once per window
+THROTTLE_COOLDOWN = 2.0
+
+VERBOSE = False
+
+
+# --------------------------------------------------
+# Limiters
+# --------------------------------------------------
+class TokenBucket:
+    """Refills `rate_per_min` units per minute up to `rate_per_min`."""
+
+    def __init__(self, rate_per_min):
+        self.capacity = float(rate_per_min)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1.0):
+        amount = min(float(amount), self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+            time.sleep(wait)
+
+    def debit(self, amount):
+        """Charge usage beyond what was reserved; the level may go negative."""
+        with self.lock:
+            self._refill()
+            self.level -= amount
+
+
+class AdaptiveConcurrency:
+    """Additive-increase / multiplicative-decrease cap on in-flight calls."""
+
+    def __init__(self, max_limit, min_limit=1, cooldown=THROTTLE_COOLDOWN):
+        self.max_limit = float(max_limit)
+        self.min_limit = float(min_limit)
+        self.limit = float(max_limit)
+        self.cooldown = cooldown
+        self.last_cut = None
+        self.in_flight = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self.cond:
+            self.in_flight -= 1
+            if throttled:
+                now = time.monotonic()
+                if self.last_cut is None or now - self.last_cut >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self.last_cut = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+class ModelLimiter:
+    def __init__(self, limits):
+        self.requests = TokenBucket(limits["rpm"])
+        self.tokens = TokenBucket(limits["tpm"])
+        self.concurrency = AdaptiveConcurrency(limits["max_concurrency"])
+        self.max_retries = limits["max_retries"]
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hold back every call to this model for `seconds`."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def wait_if_paused(self):
+        while True:
+            with self.lock:
+                wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+# --------------------------------------------------
+# Shared state
+# --------------------------------------------------
+_lock = threading.Lock()
+_client = None
+_limits = None
+_limiters = {}
+_stats = {
+    "calls": 0, "retries": 0, "throttled": 0, "server_errors": 0, "failures": 0,
+    "prompt_tokens": 0, "cached_tokens": 0, "output_tokens": 0,
+}
+
+
+def load_limits(path=LIMITS_PATH):
+    if not os.path.exists(path):
+        return {"default": dict(DEFAULT_LIMITS)}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get_client():
+    """Return the process-wide OpenAI client, building it on first use."""
+    global _client
+    with _lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from openai import OpenAI
+
+            load_dotenv()
+            # Retries are handled here so they share the limiter state
+            _client = OpenAI(max_retries=0)
+        return _client
+
+
+def get_limiter(model):
+    global _limits
+    with _lock:
+        if _limits is None:
+            _limits = load_limits()
+        if model not in _limiters:
+            limits = dict(DEFAULT_LIMITS)
+            limits.update(_limits.get("default", {}))
+            limits.update(_limits.get(model, {}))
+            _limiters[model] = ModelLimiter(limits)
+        return _limiters[model]
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _lock:
+        for k in _stats:
+            _stats[k] = 0
+
+
+def _bump(key, amount=1):
+    with _lock:
+        _stats[key] += amount
+
+
+def usage_counts(usage):
+    """(prompt, cached, output) tokens from a chat or responses usage object."""
+    if usage is None:
+        return 0, 0, 0
+    if hasattr(usage, "input_tokens"):
+        details = getattr(usage, "input_tokens_details", None)
+        return usage.input_tokens, getattr(details, "cached_tokens", 0) or 0, usage.output_tokens
+    details = getattr(usage, "prompt_tokens_details", None)
+    return usage.prompt_tokens, getattr(details, "cached_tokens", 0) or 0, usage.completion_tokens
+
+
+def record_usage(model, usage):
+    prompt, cached, output = usage_counts(usage)
+    _bump("prompt_tokens", prompt)
+    _bump("cached_tokens", cached)
+    _bump("output_tokens", output)
+    if VERBOSE:
+        print(f"{model}: {prompt} prompt tokens ({cached} cached), {output} output tokens")
+    return prompt + output
+
+
+# --------------------------------------------------
+# Retry helpers
+# --------------------------------------------------
+def estimate_tokens(content):
+    """Rough chars/4 estimate over nested message content."""
+    if isinstance(content, str):
+        return len(content) // 4
+    if isinstance(content, list):
+        return sum(estimate_tokens(c) for c in content)
+    if isinstance(content, dict):
+        # Images are billed by tile, not by base64 length
+        if content.get("type") in ("input_image", "image_url"):
+            return 800
+        return sum(estimate_tokens(v) for k, v in content.items() if k in ("content", "text"))
+    return 0
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_seconds(attempt, error=None):
+    delay = retry_after_seconds(error) if error is not None else None
+    if delay is None:
+        delay = min(MAX_BACKOFF, 0.5 * 2 ** attempt) * (0.75 + random.random() / 4)
+    return min(delay, MAX_BACKOFF)
+
+
+def _call(model, est_tokens, send):
+    import openai
+
+    limiter = get_limiter(model)
+    _bump("calls")
+    for attempt in range(limiter.max_retries + 1):
+        limiter.wait_if_paused()
+        limiter.requests.acquire()
+        limiter.tokens.acquire(est_tokens)
+        limiter.concurrency.acquire()
+        throttled = False
+        try:
+            response = send()
+        except openai.RateLimitError as e:
+            throttled = True
+            _bump("throttled")
+            error = e
+        except openai.APIStatusError as e:
+            if e.status_code < 500:
+                raise
+            _bump("server_errors")
+            error = e
+        except openai.APIConnectionError as e:
+            error = e
+        else:
+            used = record_usage(model, getattr(response, "usage", None))
+            if used > est_tokens:
+                limiter.tokens.debit(used - est_tokens)
+            return response
+        finally:
+            limiter.concurrency.release(throttled=throttled)
+
+        if attempt == limiter.max_retries:
+            _bump("failures")
+            raise error
+        _bump("retries")
+        delay = backoff_seconds(attempt, error)
+        if throttled and retry_after_seconds(error) is not None:
+            # The server said when to come back; hold the whole model, not just this thread
+            limiter.pause(delay)
+        else:
+            time.sleep(delay)
+
+
+# --------------------------------------------------
+# Public API
+# --------------------------------------------------
+def chat_completion(model, messages, client=None, **kwargs):
+    client = client or get_client()
+    est = estimate_tokens(messages) + kwargs.get("max_tokens", EST_OUTPUT_TOKENS)
+    return _call(
+        model, est,
+        lambda: client.chat.completions.create(model=model, messages=messages, **kwargs),
+    )
+
+
+def create_response(model, input, client=None, **kwargs):
+    client = client or get_client()
+    est = estimate_tokens(input) + kwargs.get("max_output_tokens", EST_OUTPUT_TOKENS)
+    return _call(
+        model, est,
+        lambda: client.responses.create(model=model, input=input, **kwargs),
+    )
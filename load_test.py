@@ -0,0 +1,169 @@
+"""Drive the generation and eval scripts against the fake OpenAI server.
+
+    python load_test.py --calls 50 --concurrency 8 --rate-429 0.1 --latency lognormal:0.3,0.6
+
+Reports requests/sec, latency percentiles and how many extra HTTP requests
+the shared client's retries cost for each target.
+"""
+import argparse
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_openai_server import CANNED_PAGED_STORY, FakeOpenAIServer
+
+TARGETS = ["decodable", "student", "eval_text", "eval_images", "eval_pages"]
+
+SAMPLE_IMAGE_DIR = os.path.join("generated_book", "images")
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+# --------------------------------------------------
+# One unit of work per target
+# --------------------------------------------------
+def make_jobs(workdir):
+    import llm_client
+    import specified_story
+    import unspecified_decodable
+    from cli import _load_script
+
+    evaluator = _load_script("unspecified_eval_k-2.py", "unspecified_eval_k2")
+    evaluator.VERBOSE = False
+    evaluator.EVAL_PATH = os.path.join(workdir, "evaluations")
+
+    story_path = os.path.join(workdir, "story.txt")
+    with open(story_path, "w", encoding="utf-8") as f:
+        f.write(CANNED_PAGED_STORY)
+
+    fry_words = unspecified_decodable.load_fry_words(limit=50)
+    review_words = ["cat", "map", "sat", "pit", "dig"]
+    target_words = ["van", "sand", "plan", "flag"]
+    student = {"id": "1", "name": "Emma Johnson", "age": 5, "grade": "K", "interests": "Reading fairytales", "ethnicity": "Caucasian"}
+
+    def decodable():
+        outline = unspecified_decodable.generate_story_outline(
+            fry_words, review_words, target_words, 35, "K", "mid", "8–10", "about 5"
+        )
+        unspecified_decodable.generate_decodable_story(
+            fry_words, review_words, target_words, outline, 35, "K", "mid", "8–10", "about 5"
+        )
+
+    def student_story():
+        specified_story.generate_decodable_story(student, specified_story.phonics_patterns[0])
+
+    job_ids = itertools.count()
+
+    def eval_text():
+        # A fresh word order per job, so near-duplicate reuse doesn't turn
+        # the run into a cache benchmark
+        n = next(job_ids)
+        rng = random.Random(n)
+        lines = []
+        for line in CANNED_PAGED_STORY.splitlines():
+            words = line.split()
+            rng.shuffle(words)
+            lines.append(" ".join(words))
+        path = os.path.join(workdir, f"story_{n}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+        evaluator.eval_text(llm_client.get_client(), path)
+
+    def eval_images():
+        evaluator.eval_images(llm_client.get_client(), story_path, SAMPLE_IMAGE_DIR)
+
+    def eval_pages():
+        # Page results are cached by content, so only the first job calls the API
+        evaluator.eval_pages(llm_client.get_client(), story_path, SAMPLE_IMAGE_DIR)
+
+    return {
+        "decodable": decodable,
+        "student": student_story,
+        "eval_text": eval_text,
+        "eval_images": eval_images,
+        "eval_pages": eval_pages,
+    }
+
+
+def run_target(name, job, calls, concurrency):
+    latencies = []
+    failures = []
+
+    def timed():
+        start = time.perf_counter()
+        try:
+            job()
+        except Exception as e:  # noqa: BLE001 - report every failure kind
+            failures.append(type(e).__name__)
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(calls):
+            pool.submit(timed)
+    wall = time.perf_counter() - start
+    return {"name": name, "wall": wall, "latencies": latencies, "failures": failures}
+
+
+def summarize(result, server_stats, client_stats):
+    http_requests = sum(sum(by_status.values()) for by_status in server_stats.values())
+    throttled = sum(by_status.get(429, 0) for by_status in server_stats.values())
+    server_errors = sum(n for by_status in server_stats.values() for code, n in by_status.items() if code >= 500)
+    lat = result["latencies"]
+    print(f"\n{result['name']}\n" + "-" * 30)
+    print(f"completed: {len(lat)}  failed: {len(result['failures'])}")
+    print(f"wall time: {result['wall']:.2f}s  throughput: {len(lat) / result['wall']:.2f} jobs/s, {http_requests / result['wall']:.2f} req/s")
+    print(f"latency p50: {percentile(lat, 50):.3f}s  p95: {percentile(lat, 95):.3f}s  p99: {percentile(lat, 99):.3f}s")
+    print(f"http requests: {http_requests}  429s: {throttled}  5xx: {server_errors}")
+    print(f"client retries: {client_stats['retries']}  gave up: {client_stats['failures']}")
+    if result["failures"]:
+        print(f"failure types: {sorted(set(result['failures']))}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--targets", nargs="+", choices=TARGETS, default=TARGETS)
+    parser.add_argument("--calls", type=int, default=20, help="jobs per target")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", default="uniform:0.05,0.25")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(
+        ("127.0.0.1", 0), latency=args.latency,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, retry_after=args.retry_after,
+    )
+    server.start_background()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "test"
+
+    import llm_client
+
+    workdir = tempfile.mkdtemp(prefix="load_test_")
+    try:
+        jobs = make_jobs(workdir)
+        for name in args.targets:
+            server.reset_stats()
+            llm_client.reset_stats()
+            result = run_target(name, jobs[name], args.calls, args.concurrency)
+            summarize(result, server.stats, llm_client.stats())
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Deterministic sharding of generation and eval runs across machines.
+
+`--shard i/N` (0-based i) keeps only the jobs whose stable hash lands on
+shard i, so every worker agrees on the split without coordination. Each
+shard writes under `<output_dir>/_shards/shard_i_of_N/` with a manifest,
+and `merge_shards(output_dir)` folds all shard directories back into the
+normal layout:
+
+- plain files are copied to the same relative path
+- JSONL indexes (e.g. minhash_index.jsonl) are appended to the existing
+  index, with shard paths in keys rewritten to the merged paths; records a
+  previous merge added are replaced, everything else is kept
+- manifests are combined into `<output_dir>/manifest.json`
+"""
+import hashlib
+import json
+import os
+import shutil
+
+SHARDS_DIR = "_shards"
+MANIFEST = "manifest.json"
+
+# Counters in manifests that are summed when merging
+SUMMED_STATS = ("calls", "retries", "throttled", "server_errors", "failures",
+                "prompt_tokens", "cached_tokens", "output_tokens")
+
+
+def parse_shard(spec):
+    """Parse `i/N` into (i, N); None passes through for unsharded runs."""
+    if spec is None:
+        return None
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got {spec!r}") from None
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Shard index must be in [0, {count}), got {spec!r}")
+    return index, count
+
+
+def stable_hash(key):
+    return int.from_bytes(hashlib.sha1(str(key).encode("utf-8")).digest()[:8], "big")
+
+
+def in_shard(key, shard):
+    if shard is None:
+        return True
+    index, count = shard
+    return stable_hash(key) % count == index
+
+
+def select(items, shard, key=str):
+    """Items of `items` owned by `shard`, in their original order."""
+    return [item for item in items if in_shard(key(item), shard)]
+
+
+def shard_dir(output_dir, shard):
+    if shard is None:
+        return output_dir
+    index, count = shard
+    return os.path.join(output_dir, SHARDS_DIR, f"shard_{index}_of_{count}")
+
+
+def write_manifest(out_dir, shard, outputs, metrics=None, stats=None):
+    """Record what a shard produced; a no-op for unsharded runs."""
+    if shard is None:
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {
+        "shard": list(shard),
+        "outputs": sorted(os.path.relpath(p, out_dir) for p in outputs),
+        "metrics": metrics or {},
+        "stats": stats or {},
+    }
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return path
+
+
+def _rewrite(value, old_root, new_root):
+    if isinstance(value, str) and value.startswith(old_root):
+        return new_root + value[len(old_root):]
+    return value
+
+
+def _drop_keys(path, keys):
+    """Rewrite a JSONL index without the records for `keys`."""
+    if not keys or not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line for line in f if json.loads(line).get("key") not in keys]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, path)
+
+
+def _merge_jsonl(src, dest, old_root, new_root):
+    """Append src records to dest, writing the params header only once.
+
+    Returns the keys appended.
+    """
+    has_header = os.path.exists(dest) and os.path.getsize(dest) > 0
+    keys = []
+    with open(src, "r", encoding="utf-8") as fin, open(dest, "a", encoding="utf-8") as fout:
+        for line in fin:
+            record = json.loads(line)
+            if "params" in record:
+                if has_header:
+                    continue
+                has_header = True
+            else:
+                for field in ("key", "canonical"):
+                    if field in record:
+                        record[field] = _rewrite(record[field], old_root, new_root)
+                keys.append(record["key"])
+            fout.write(json.dumps(record) + "\n")
+    return keys
+
+
+def merge_shards(output_dir, allow_partial=False):
+    """Fold every shard under output_dir into the standard layout.
+
+    Returns the combined manifest. Raises ValueError when shards are
+    missing, unless allow_partial is set.
+    """
+    root = os.path.join(output_dir, SHARDS_DIR)
+    if not os.path.isdir(root):
+        raise ValueError(f"No shards found under {root}")
+
+    manifests = []
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name, MANIFEST)
+        if os.path.isfile(path):
+            with open(path, "r", encoding="utf-8") as f:
+                manifests.append((os.path.join(root, name), json.load(f)))
+    if not manifests:
+        raise ValueError(f"No shard manifests found under {root}")
+
+    counts = {m["shard"][1] for _, m in manifests}
+    if len(counts) != 1:
+        raise ValueError(f"Shards from different splits found: N in {sorted(counts)}")
+    count = counts.pop()
+    missing = sorted(set(range(count)) - {m["shard"][0] for _, m in manifests})
+    if missing and not allow_partial:
+        raise ValueError(f"Missing shards {missing} of {count}")
+
+    # Index records added by an earlier merge are replaced by this one;
+    # records from unsharded runs stay
+    manifest_path = os.path.join(output_dir, MANIFEST)
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f).get("index_keys", {})
+    for rel, keys in previous.items():
+        _drop_keys(os.path.join(output_dir, rel), set(keys))
+
+    combined = {"shards": [], "missing": missing, "outputs": [], "metrics": {}, "stats": {},
+                "index_keys": {}}
+    for src_root, manifest in manifests:
+        for dirpath, _, filenames in os.walk(src_root):
+            for filename in filenames:
+                src = os.path.join(dirpath, filename)
+                rel = os.path.relpath(src, src_root)
+                if rel == MANIFEST:
+                    continue
+                dest = os.path.join(output_dir, rel)
+                os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+                if filename.endswith(".jsonl"):
+                    keys = _merge_jsonl(src, dest, src_root, output_dir)
+                    combined["index_keys"].setdefault(rel, []).extend(keys)
+                else:
+                    shutil.copy2(src, dest)
+
+        combined["shards"].append(manifest["shard"])
+        combined["outputs"].extend(manifest["outputs"])
+        combined["metrics"].update(manifest["metrics"])
+        for k, v in manifest["stats"].items():
+            if k in SUMMED_STATS:
+                combined["stats"][k] = combined["stats"].get(k, 0) + v
+
+    combined["outputs"].sort()
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(combined, f, indent=2)
+    return combined
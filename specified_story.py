@@ -1,15 +1,16 @@
 import os
 import random
 import re
-from openai import OpenAI
-from dotenv import load_dotenv
-import pronouncing
 
-load_dotenv()
-client = OpenAI()
+import llm_client
+import sharding
+import story_dedup
 
 OUTPUT_DIR = "generated_student_stories"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+# Regenerate (hotter) when a story is a near-duplicate of one already written
+MAX_DIVERSITY_RETRIES = 2
+RETRY_TEMPERATURE = 1.0
 
 # GPT-friendly phonics descriptions
 phonics_patterns = [
@@ -24,6 +25,8 @@ def clean_text(text):
     return re.sub(r'[^a-zA-Z\s]', '', text.lower()).split()
 
 def word_matches_pattern(word, pattern):
+    import pronouncing
+
     word = word.lower()
     phones = pronouncing.phones_for_word(word)
     if not phones:
@@ -55,7 +58,22 @@ def calculate_diversity_score(story_text):
     unique_count = len(set(words))
     return unique_count / len(words)
 
-def generate_decodable_story(student_profile, phonics_pattern, num_pages=5):
+# Rules shared by every student and pattern; kept in the system message so
+# all requests start with the same prefix. At ~115 tokens (plus a short
+# profile) these prompts stay under the 1024-token caching minimum, so they
+# get no cached tokens until the rules grow past it
+SYSTEM_PROMPT = """
+You write decodable texts for K–2 students. In every story:
+- Include at least 10 words with the given phonics pattern
+- Do not use multisyllabic or complex words OR words with digraphs and other complex phonics patterns
+- Do not use commas or appositives
+- Use high-frequency words naturally
+- Have a clear problem, events, and solution
+- All other character names should follow the phonics pattern
+- Sentences should be simple, repetitive, and easy to decode
+"""
+
+def generate_decodable_story(student_profile, phonics_pattern, num_pages=5, temperature=0.7):
     if student_profile["grade"] == "K":
         sentence_rule = "Each page should have exactly **1 sentence**."
     elif student_profile["grade"] == "1":
@@ -66,54 +84,84 @@ def generate_decodable_story(student_profile, phonics_pattern, num_pages=5):
     prompt = f"""
 Create a decodable text for a grade {student_profile['grade']} student aged {student_profile['age']}:
 - Focus on the phonics pattern: {phonics_pattern}
-- Include at least 10 words with this phonics pattern
-- Do not use multisyllabic or complex words OR words with digraphs and other complex phonics patterns
-- Do not use commas or appositives
-- Use high-frequency words naturally
-- Have a clear problem, events, and solution
 - Use "{student_profile['name']}" as the main character
-- All other character names should follow the phonics pattern
 - The story should primarily be about: {student_profile['interests']}
 - Attend to {student_profile['ethnicity']} cultural context in names or setting
-- Sentences should be simple, repetitive, and easy to decode
 - {sentence_rule}
 - The story should have {num_pages} pages, each separated by '---'
 """
 
-    response = client.chat.completions.create(
+    response = llm_client.chat_completion(
         model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.7,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=temperature,
     )
     return response.choices[0].message.content.strip()
 
-def main():
+def main(shard=None):
     student_profiles = [
         {"id": "1", "name": "Emma Johnson", "age": 5, "grade": "K", "interests": "Reading fairytales", "ethnicity": "Caucasian"},
         {"id": "2", "name": "Liam Chen", "age": 6, "grade": "1", "interests": "Science fiction stories", "ethnicity": "Chinese/Asian"},
         {"id": "5", "name": "Aisha Patel", "age": 8, "grade": "2", "interests": "Sports and fitness", "ethnicity": "South Asian/Indian"},
     ]
 
+    output_dir = sharding.shard_dir(OUTPUT_DIR, shard)
+    os.makedirs(output_dir, exist_ok=True)
+    dedup_index = story_dedup.MinHashIndex(path=os.path.join(output_dir, "minhash_index.jsonl"))
+    outputs, metrics = [], {}
+    run_before = llm_client.stats()
+
     for student in student_profiles:
-        student_dir = os.path.join(OUTPUT_DIR, f"{student['name'].replace(' ', '_')}")
-        os.makedirs(student_dir, exist_ok=True)
+        student_dir = os.path.join(output_dir, f"{student['name'].replace(' ', '_')}")
 
         for i, phonics_pattern in enumerate(phonics_patterns, start=1):
+            if not sharding.in_shard(f"student:{student['id']}:{phonics_pattern}", shard):
+                continue
+            os.makedirs(student_dir, exist_ok=True)
+            usage_before = llm_client.stats()
             print(f"Generating story {i} for {student['name']} (Grade {student['grade']}), pattern: {phonics_pattern}")
 
+            story_file = os.path.join(student_dir, f"story_{i}.txt")
             story_text = generate_decodable_story(student, phonics_pattern)
+            for _ in range(MAX_DIVERSITY_RETRIES):
+                duplicate = dedup_index.find_duplicate(story_text)
+                if duplicate is None or duplicate[0] == story_file:
+                    break
+                print(f"Near-duplicate of {duplicate[0]} ({duplicate[1]:.2f}), regenerating")
+                story_text = generate_decodable_story(student, phonics_pattern, temperature=RETRY_TEMPERATURE)
+            dedup_index.add(story_file, story_text)
 
             decodable_score = calculate_decodable_score(story_text, phonics_pattern)
             diversity_score = calculate_diversity_score(story_text)
 
-            story_file = os.path.join(student_dir, f"story_{i}.txt")
             with open(story_file, "w", encoding="utf-8") as f:
                 f.write(f"Phonics Pattern: {phonics_pattern}\n\n")
                 f.write(story_text + "\n\n")
                 f.write(f"Decodable Score: {decodable_score:.2f}\n")
                 f.write(f"Diversity Score: {diversity_score:.2f}\n")
 
+            usage = llm_client.stats()
+            prompt_tokens = usage["prompt_tokens"] - usage_before["prompt_tokens"]
+            cached_tokens = usage["cached_tokens"] - usage_before["cached_tokens"]
+            print(f"Prompt tokens: {prompt_tokens} ({cached_tokens} cached)")
             print(f"Saved story {i} for {student['name']} with decodable score {decodable_score:.2f} and diversity score {diversity_score:.2f}.\n")
+            outputs.append(story_file)
+            metrics[os.path.relpath(story_file, output_dir)] = {
+                "student": student["id"],
+                "pattern": phonics_pattern,
+                "decodable_score": decodable_score,
+                "diversity_score": diversity_score,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+            }
+
+    usage = llm_client.stats()
+    sharding.write_manifest(
+        output_dir, shard, outputs, metrics, {k: usage[k] - run_before[k] for k in usage}
+    )
 
 if __name__ == "__main__":
     main()
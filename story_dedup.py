@@ -0,0 +1,253 @@
+"""MinHash/LSH index for spotting near-duplicate stories.
+
+Each story is reduced to word shingles and a MinHash signature; signatures
+are banded into LSH buckets so a lookup only compares against stories that
+share a bucket. The index is appended to a JSONL file as stories are added,
+so generation runs can build it incrementally and evaluation can reload it.
+Re-adding an unchanged story with the metadata it already has writes
+nothing; a file that has grown mostly superseded records is compacted to
+one record per story when it is loaded.
+
+The num_perm hash functions come from one SHAKE-128 digest per shingle,
+read as num_perm 32-bit values, and the signature is their elementwise
+minimum. Both steps run in C. Signatures live in one flat `array("I")` and
+bucket entries are plain ints, so 100k stories fit comfortably in memory.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from array import array
+
+MAX_HASH = (1 << 32) - 1
+
+DEFAULT_THRESHOLD = 0.8
+
+# Compact an index file on load once it holds this many records per story
+COMPACT_RATIO = 2
+
+
+def shingles(text, size=3):
+    """Lowercased word n-grams; headers and scores are just more words."""
+    words = re.findall(r"[a-z]+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def choose_bands(num_perm, threshold):
+    """Pick (bands, rows) whose S-curve midpoint sits just under `threshold`."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        midpoint = (1 / bands) ** (1 / rows)
+        if midpoint <= threshold and (best is None or midpoint > best[0]):
+            best = (midpoint, bands, rows)
+    return best[1], best[2]
+
+
+class MinHashIndex:
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_perm=128, shingle_size=3, seed=1, path=None):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self._salt = f"minhash-{seed}:".encode("utf-8")
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = array("I")
+        self.keys = []
+        self.ids = {}
+        self.canonical = {}
+        self.meta = {}
+        self.path = path
+        if path and os.path.exists(path):
+            self._load(path)
+
+    # ---- hashing ----
+    def signature(self, text):
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return array("I", [MAX_HASH] * self.num_perm)
+        width = 4 * self.num_perm
+        hashed = []
+        for gram in grams:
+            values = array("I", hashlib.shake_128(self._salt + gram.encode("utf-8")).digest(width))
+            if sys.byteorder == "big":
+                values.byteswap()
+            hashed.append(values)
+        return array("I", map(min, zip(*hashed)))
+
+    def _band_keys(self, sig):
+        r = self.rows
+        return [hash(tuple(sig[i * r:(i + 1) * r])) for i in range(self.bands)]
+
+    def _sig_at(self, idx):
+        return self.signatures[idx * self.num_perm:(idx + 1) * self.num_perm]
+
+    @staticmethod
+    def similarity(sig_a, sig_b):
+        """Estimated Jaccard similarity of two signatures."""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+    # ---- queries ----
+    def query(self, text=None, sig=None):
+        """Stored stories at or above the threshold, most similar first."""
+        sig = sig if sig is not None else self.signature(text)
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, self._band_keys(sig)):
+            hit = bucket.get(band_key)
+            if hit is None:
+                continue
+            if isinstance(hit, int):
+                candidates.add(hit)
+            else:
+                candidates.update(hit)
+        matches = []
+        for idx in candidates:
+            sim = self.similarity(sig, self._sig_at(idx))
+            if sim >= self.threshold:
+                matches.append((self.keys[idx], sim))
+        return sorted(matches, key=lambda m: -m[1])
+
+    def find_duplicate(self, text=None, sig=None):
+        """(canonical_key, similarity) of the closest stored near-duplicate, or None."""
+        matches = self.query(text, sig)
+        if not matches:
+            return None
+        key, sim = matches[0]
+        return self.canonical_of(key), sim
+
+    def canonical_of(self, key):
+        return self.canonical.get(key, key)
+
+    def get_meta(self, key):
+        return self.meta.get(key, {})
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.ids
+
+    # ---- updates ----
+    def add(self, key, text=None, sig=None, meta=None):
+        """Index a story. Returns the (canonical_key, similarity) it duplicates, if any.
+
+        Re-adding a key with different text replaces its signature and
+        drops its old metadata.
+        """
+        sig = array("I", sig) if sig is not None else self.signature(text)
+        matches = [(k, sim) for k, sim in self.query(sig=sig) if k != key]
+        duplicate = (self.canonical_of(matches[0][0]), matches[0][1]) if matches else None
+        canonical = duplicate[0] if duplicate else None
+        if key in self.ids:
+            if self._sig_at(self.ids[key]) == sig:
+                # Same text again: only record metadata that changed
+                stored = self.meta.setdefault(key, {})
+                changed = {k: v for k, v in (meta or {}).items() if k not in stored or stored[k] != v}
+                if changed:
+                    stored.update(changed)
+                    if self.path:
+                        self._append(key, sig, self.canonical.get(key), changed)
+                return duplicate
+            # The file was rewritten; its old signature and metadata are stale
+            self._replace(self.ids[key], sig, canonical, meta)
+        else:
+            self._insert(key, sig, canonical, meta)
+        if self.path:
+            self._append(key, sig, canonical, meta)
+        return duplicate
+
+    def _insert(self, key, sig, canonical, meta):
+        idx = len(self.keys)
+        self.keys.append(key)
+        self.ids[key] = idx
+        self.signatures.extend(sig)
+        self._set_info(key, canonical, meta)
+        self._bucket_add(idx, sig)
+
+    def _replace(self, idx, sig, canonical, meta):
+        self._bucket_remove(idx, self._sig_at(idx))
+        self.signatures[idx * self.num_perm:(idx + 1) * self.num_perm] = array("I", sig)
+        self._set_info(self.keys[idx], canonical, meta)
+        self._bucket_add(idx, sig)
+
+    def _set_info(self, key, canonical, meta):
+        self.canonical.pop(key, None)
+        self.meta.pop(key, None)
+        if canonical is not None:
+            self.canonical[key] = canonical
+        if meta:
+            self.meta[key] = dict(meta)
+
+    def _bucket_add(self, idx, sig):
+        for bucket, band_key in zip(self.buckets, self._band_keys(sig)):
+            hit = bucket.get(band_key)
+            if hit is None:
+                bucket[band_key] = idx
+            elif isinstance(hit, int):
+                bucket[band_key] = [hit, idx]
+            else:
+                hit.append(idx)
+
+    def _bucket_remove(self, idx, sig):
+        for bucket, band_key in zip(self.buckets, self._band_keys(sig)):
+            hit = bucket.get(band_key)
+            if hit == idx:
+                del bucket[band_key]
+            elif isinstance(hit, list) and idx in hit:
+                hit.remove(idx)
+                if len(hit) == 1:
+                    bucket[band_key] = hit[0]
+
+    # ---- persistence ----
+    def _params(self):
+        return {"num_perm": self.num_perm, "shingle_size": self.shingle_size, "seed": self.seed}
+
+    def _append(self, key, sig, canonical, meta):
+        new_file = not os.path.exists(self.path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            if new_file:
+                f.write(json.dumps({"params": self._params()}) + "\n")
+            record = {"key": key, "sig": list(sig), "canonical": canonical}
+            if meta:
+                record["meta"] = meta
+            f.write(json.dumps(record) + "\n")
+
+    def _load(self, path):
+        records = 0
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if "params" in record:
+                    if record["params"] != self._params():
+                        raise ValueError(f"{path} was built with {record['params']}, not {self._params()}")
+                    continue
+                records += 1
+                key, sig = record["key"], array("I", record["sig"])
+                if key not in self.ids:
+                    self._insert(key, sig, record.get("canonical"), record.get("meta"))
+                elif self._sig_at(self.ids[key]) == sig:
+                    self.meta.setdefault(key, {}).update(record.get("meta") or {})
+                else:
+                    self._replace(self.ids[key], sig, record.get("canonical"), record.get("meta"))
+        if records > len(self.keys) and records >= COMPACT_RATIO * len(self.keys):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the index file with one record per story."""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"params": self._params()}) + "\n")
+            for idx, key in enumerate(self.keys):
+                record = {"key": key, "sig": list(self._sig_at(idx)), "canonical": self.canonical.get(key)}
+                if self.meta.get(key):
+                    record["meta"] = self.meta[key]
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,388 @@
+"""Local repair of out-of-vocabulary words in generated decodable stories.
+
+Runs after `generate_decodable_story`. Words that `analyze_story` would count
+as leftovers are swapped for an allowed Fry, review or target word with the
+same Penn part-of-speech tag and syllable count that means the same thing:
+a WordNet synonym of the word's dominant sense, or for nouns its direct
+hypernym ("hike" -> "walk"). Sound-alikes with unrelated meanings are
+never used, and neither is a verb that may be phrasal ("making up").
+
+Tags come from the lemminflect lexicon; a word that can take several tags
+is only swapped when the previous word settles which one it is. Sentences
+that still contain a leftover after that are sent back to the model, in one
+call. Without the WordNet corpus (`nltk.download("wordnet")`) nothing is
+swapped locally and every such sentence goes to the model.
+"""
+import json
+import re
+import string
+
+import llm_client
+from analysis import LESSON_PHONEMES, classify_word
+
+# --------------------------------------------------
+# Part-of-speech lexicon
+# --------------------------------------------------
+# Function words are never swapped; lemminflect has no entries for them
+CLOSED_CLASS = {
+    **dict.fromkeys(["a", "an", "the", "this", "that", "these", "those", "my", "your", "his",
+                     "her", "its", "our", "their", "some", "each", "every", "no", "all"], "det"),
+    **dict.fromkeys(["i", "you", "he", "she", "it", "we", "they", "me", "him", "us", "them",
+                     "what", "who"], "pron"),
+    **dict.fromkeys(["in", "on", "at", "to", "of", "for", "with", "from", "by", "up", "down",
+                     "into", "over", "under", "out", "off", "past", "about", "around"], "prep"),
+    **dict.fromkeys(["and", "but", "or", "so", "if", "then", "when", "as"], "conj"),
+    **dict.fromkeys(["is", "am", "are", "was", "were", "be", "been", "has", "have", "had", "do",
+                     "did", "does", "can", "will", "could", "would", "should", "may", "might",
+                     "must", "not"], "aux"),
+}
+
+# Previous words that settle an ambiguous tag, and the tags they allow next
+NOUN_PHRASE_START = {"a", "an", "the", "my", "your", "our", "their", "its", "every", "each"}
+MODALS = {"can", "will", "could", "would", "should", "may", "might", "must", "do", "did", "does"}
+THIRD_PERSON = {"he", "she", "it"}
+OTHER_PERSON = {"i", "you", "we", "they"}
+
+# A verb followed by one of these may be phrasal ("make up"); its meaning
+# isn't the verb's, so it is left for the model
+PARTICLES = {"up", "down", "out", "off", "over", "away", "back", "on", "in", "around"}
+
+NOUN_PHRASE_TAGS = {"NN", "NNS", "JJ", "JJR", "JJS"}
+BASE_VERB_TAGS = {"VB"}
+THIRD_PERSON_TAGS = {"VBZ", "VBD"}
+OTHER_PERSON_TAGS = {"VB", "VBD"}
+
+SENTENCE_END = (".", "!", "?", "”", '"')
+
+STRIP_CHARS = string.punctuation + "“”‘"
+
+# WordNet part of speech for each Penn tag that can be swapped
+WORDNET_POS = {
+    "NN": "n", "NNS": "n",
+    "VB": "v", "VBD": "v", "VBG": "v", "VBN": "v", "VBZ": "v",
+    "JJ": "a", "JJR": "a", "JJS": "a",
+    "RB": "r",
+}
+
+# The story's word is read in its dominant sense; a substitute may match
+# through any of its most common senses. Rare senses ("hear" as "learn")
+# would otherwise link unrelated words.
+WORD_SENSES = 1
+CANDIDATE_SENSES = 3
+
+UPOS = {"n": "NOUN", "v": "VERB", "a": "ADJ", "r": "ADV"}
+NOUN_NUMBER = {"NN", "NNS"}
+
+_tags = {}
+_senses = {}
+_wordnet = None
+
+
+def word_tags(word):
+    """Penn tags the word can take, from the lemminflect lexicon.
+
+    VBP is folded into VB since the two are always spelled alike. Function
+    words get their CLOSED_CLASS label; unknown words get an empty set.
+    """
+    if word in CLOSED_CLASS:
+        return frozenset([CLOSED_CLASS[word]])
+    if word not in _tags:
+        import lemminflect
+
+        tags = set()
+        for upos, lemmas in lemminflect.getAllLemmas(word).items():
+            for lemma in lemmas:
+                for tag, forms in lemminflect.getAllInflections(lemma, upos=upos).items():
+                    if word in forms:
+                        tags.add("VB" if tag == "VBP" else tag)
+        _tags[word] = frozenset(tags)
+    return _tags[word]
+
+
+def tag_in_context(word, prev, names=()):
+    """The word's tag given the previous word, or None if it stays ambiguous."""
+    tags = word_tags(word)
+    if len(tags) > 1 and prev:
+        if prev in NOUN_PHRASE_START:
+            tags = tags & NOUN_PHRASE_TAGS
+        elif prev in MODALS:
+            tags = tags & BASE_VERB_TAGS
+        elif prev in OTHER_PERSON:
+            tags = tags & OTHER_PERSON_TAGS
+        elif prev in THIRD_PERSON or prev in names:
+            tags = tags & THIRD_PERSON_TAGS
+    if len(tags) != 1:
+        return None
+    return next(iter(tags))
+
+
+def get_wordnet():
+    """NLTK's WordNet reader, or False if nltk or the corpus is missing."""
+    global _wordnet
+    if _wordnet is None:
+        try:
+            from nltk.corpus import wordnet
+
+            wordnet.synsets("cat")
+            _wordnet = wordnet
+        except (ImportError, LookupError):
+            _wordnet = False
+    return _wordnet
+
+
+def lemmas_for(word, tag):
+    """Lemmas of which `word` is the `tag` form ("saw" as VB is "saw", not "see")."""
+    import lemminflect
+
+    upos = UPOS[WORDNET_POS[tag]]
+    found = []
+    for lemma in lemminflect.getAllLemmas(word).get(upos, ()):
+        forms = lemminflect.getAllInflections(lemma, upos=upos)
+        if word in forms.get(tag, ()) or (tag == "VB" and word in forms.get("VBP", ())):
+            found.append(lemma)
+    return found or [word]
+
+
+def senses(word, tag, limit):
+    """The first `limit` WordNet senses of the word's lemma for this tag."""
+    key = (word, tag, limit)
+    if key not in _senses:
+        wordnet = get_wordnet()
+        found = []
+        if wordnet:
+            for lemma in lemmas_for(word, tag):
+                # synsets() also lemmatizes, so "saw" would bring in "see"; keep exact lemmas
+                found += [s for s in wordnet.synsets(lemma, WORDNET_POS[tag]) if lemma in s.lemma_names()][:limit]
+        _senses[key] = found
+    return _senses[key]
+
+
+def meaning_score(word, candidate, tag):
+    """How well `candidate` keeps the meaning of `word`, or None if it doesn't.
+
+    1.0 for a synonym of the word's dominant sense, 0.9 for a noun's direct
+    hypernym (a more general word) whose head lemma is the candidate, so
+    "noise" -> "sound" but not "farm" -> "work" (listed under "workplace").
+    """
+    if tag not in WORDNET_POS:
+        return None
+    # lemminflect lists some singulars as plurals too ("day"); keep the number
+    if tag in NOUN_NUMBER and word_tags(word) & NOUN_NUMBER != word_tags(candidate) & NOUN_NUMBER:
+        return None
+    word_senses = senses(word, tag, WORD_SENSES)
+    candidate_senses = set(senses(candidate, tag, CANDIDATE_SENSES))
+    if not word_senses or not candidate_senses:
+        return None
+    if candidate_senses.intersection(word_senses):
+        return 1.0
+    if WORDNET_POS[tag] == "n":
+        heads = {h.lemma_names()[0] for s in word_senses for h in s.hypernyms()}
+        if heads.intersection(lemmas_for(candidate, tag)):
+            return 0.9
+    return None
+
+
+def phones_for(word):
+    """First CMU pronunciation without stress marks, or letters as a fallback."""
+    import pronouncing
+
+    phones = pronouncing.phones_for_word(word)
+    if phones:
+        return tuple(re.sub(r"\d", "", p) for p in phones[0].split())
+    return tuple(word)
+
+
+def syllable_count(word):
+    import pronouncing
+
+    phones = pronouncing.phones_for_word(word)
+    if phones:
+        return pronouncing.syllable_count(phones[0])
+    return max(1, len(re.findall(r"[aeiouy]+", word)))
+
+
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        cur = [i]
+        for j, y in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (x != y)))
+        prev = cur
+    return prev[-1]
+
+
+# --------------------------------------------------
+# Substitution index
+# --------------------------------------------------
+def build_substitution_index(fry_words, review_words, target_words):
+    """Map (tag, syllables) to (priority, word, phones) entries.
+
+    A word is listed under every tag it can take. Priority 0 is a target
+    word, 1 a review word and 2 a Fry word.
+    """
+    index = {}
+    seen = set()
+    for priority, source in enumerate((target_words, review_words, fry_words)):
+        for word in sorted(source):
+            if word in seen or not word.isalpha() or word in CLOSED_CLASS:
+                continue
+            seen.add(word)
+            entry = (priority, word, phones_for(word))
+            syllables = syllable_count(word)
+            for tag in word_tags(word):
+                index.setdefault((tag, syllables), []).append(entry)
+    return index
+
+
+def pick_substitute(word, tag, index, used):
+    """Allowed word with the same tag and syllable count and the closest meaning.
+
+    Ties go to target words, then review words, then the closest sound.
+    None if no allowed word is a synonym or more general word.
+    """
+    phones = phones_for(word)
+    best = None
+    for priority, candidate, cand_phones in index.get((tag, syllable_count(word)), []):
+        if candidate in used:
+            continue
+        score = meaning_score(word, candidate, tag)
+        if score is None:
+            continue
+        rank = (-score, priority, edit_distance(phones, cand_phones), candidate)
+        if best is None or rank < best:
+            best = rank
+    return best[3] if best else None
+
+
+def _base(word):
+    return word.split("’")[0].split("'")[0]
+
+
+def find_names(lines):
+    """Guess character names from capitalization.
+
+    A word is a name if it is capitalized mid-sentence, or if it is always
+    capitalized and appears more than once. Pronouns and other function
+    words are never names.
+    """
+    names = set()
+    capitalized, lowercase = {}, set()
+    for line in lines:
+        prev = ""
+        for token in line.split():
+            core = token.strip(STRIP_CHARS)
+            if not core:
+                continue
+            word = _base(core.lower())
+            if not core[0].isupper():
+                lowercase.add(word)
+            elif prev and not prev.endswith(SENTENCE_END):
+                names.add(word)
+            else:
+                capitalized[word] = capitalized.get(word, 0) + 1
+            prev = token
+    names.update(w for w, n in capitalized.items() if n > 1 and w not in lowercase)
+    return names - CLOSED_CLASS.keys()
+
+
+# --------------------------------------------------
+# Repair
+# --------------------------------------------------
+def repair_line(line, index, is_leftover, names):
+    """Return (fixed_line, replacements, resolved).
+
+    A leftover whose tag can't be settled, or with no allowed word of the
+    same meaning, leaves the line unresolved for the model. Function words
+    are left alone: no substitute exists for "the" or "they", and sending
+    every sentence that has one to the model would cost a call per story.
+    """
+    parts = re.split(r"(\s+)", line)
+    cores = [p.strip().strip(STRIP_CHARS) for p in parts]
+    used = {c.lower() for c in cores}
+    replacements = []
+    resolved = True
+    prev = None
+    for i, token in enumerate(parts):
+        core = cores[i]
+        word = core.lower()
+        if not core:
+            continue
+        prev_word, prev = prev, (None if token.rstrip().endswith(SENTENCE_END) else _base(word))
+        if _base(word) in names or word in CLOSED_CLASS or not is_leftover(word):
+            continue
+        tag = tag_in_context(word, prev_word, names)
+        next_word = next((c.lower() for c in cores[i + 1:] if c), None)
+        if tag and tag.startswith("VB") and next_word in PARTICLES and not token.rstrip().endswith((",", ".")):
+            tag = None
+        substitute = pick_substitute(word, tag, index, used) if tag else None
+        if substitute is None:
+            resolved = False
+            continue
+        if core[0].isupper():
+            substitute = substitute.capitalize()
+        start = token.index(core)
+        parts[i] = token[:start] + substitute + token[start + len(core):]
+        used.add(substitute.lower())
+        replacements.append((core, substitute))
+    return "".join(parts), replacements, resolved
+
+
+def rewrite_with_model(sentences, allowed_words):
+    prompt = f"""
+Rewrite each sentence below so it uses ONLY these words (plus character names): {allowed_words}
+Keep the meaning and keep each sentence short and decodable.
+
+Sentences (JSON array): {json.dumps(sentences)}
+
+Output a JSON array of the rewritten sentences, in the same order, and nothing else.
+"""
+    response = llm_client.chat_completion(
+        model="gpt-4o",
+        messages=[{"role": "user", "content": prompt}],
+    )
+    text = response.choices[0].message.content.strip()
+    text = re.sub(r"^```(?:json)?|```$", "", text).strip()
+    try:
+        rewritten = json.loads(text)
+    except json.JSONDecodeError:
+        return sentences
+    if not isinstance(rewritten, list) or len(rewritten) != len(sentences):
+        return sentences
+    return [str(s) for s in rewritten]
+
+
+def repair_story(story_text, lesson_num, fry_words, review_words, target_words, index=None, use_model=True):
+    """Fix leftover words locally, falling back to the model per sentence.
+
+    Returns the repaired text and a report with the local replacements and
+    the sentences that needed the model.
+    """
+    fry_words, review_words, target_words = set(fry_words), set(review_words), set(target_words)
+    target_phonemes = LESSON_PHONEMES.get(lesson_num, [])
+    if index is None:
+        index = build_substitution_index(fry_words, review_words, target_words)
+
+    def is_leftover(word):
+        return word not in target_words and classify_word(word, fry_words, review_words, target_phonemes) == "leftover"
+
+    lines = story_text.split("\n")
+    names = find_names(lines)
+    report = {"replacements": [], "model_sentences": [], "api_calls": 0}
+    unresolved = []
+    for i, line in enumerate(lines):
+        lines[i], replacements, resolved = repair_line(line, index, is_leftover, names)
+        report["replacements"].extend(replacements)
+        if not resolved:
+            unresolved.append(i)
+
+    if unresolved and use_model:
+        allowed = sorted(fry_words | review_words | target_words)
+        rewritten = rewrite_with_model([lines[i] for i in unresolved], allowed)
+        report["api_calls"] = 1
+        for i, new_line in zip(unresolved, rewritten):
+            report["model_sentences"].append(lines[i])
+            lines[i] = new_line
+    else:
+        report["model_sentences"] = [lines[i] for i in unresolved]
+
+    return "\n".join(lines), report
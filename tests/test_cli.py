@@ -0,0 +1,11 @@
+"""Argument checks that run before any script is imported."""
+import pytest
+
+import cli
+
+
+def test_student_generation_rejects_lessons(capsys):
+    with pytest.raises(SystemExit) as exc:
+        cli.main(["generate", "student", "--lessons", "35"])
+    assert exc.value.code == 2
+    assert "--lessons only applies to 'generate decodable'" in capsys.readouterr().err
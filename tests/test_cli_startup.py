@@ -0,0 +1,43 @@
+"""Startup budget for the offline CLI paths.
+
+Each check runs in a fresh interpreter so modules already imported by
+pytest don't hide a slow import.
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ANALYZE_BUDGET = 0.6  # seconds, interpreter start included
+
+STORY = os.path.join("generated_decodable_stories_two_phase", "Lesson_35", "story.txt")
+
+
+def run(*args):
+    return subprocess.run(
+        [sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+
+
+def test_analyze_within_budget():
+    argv = ("cli.py", "analyze", STORY, "--lesson", "35")
+    # The first run may rebuild the lesson-sheet cache; time the best of the rest
+    run(*argv)
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        result = run(*argv)
+        timings.append(time.perf_counter() - start)
+    assert "leftover_pct" in result.stdout
+    assert min(timings) < ANALYZE_BUDGET, f"cli.py analyze took {min(timings):.2f}s"
+
+
+def test_script_imports_stay_light():
+    result = run(
+        "-c",
+        "import sys, analysis, unspecified_decodable, specified_story; "
+        "print(sorted(m for m in ('openai', 'openpyxl') if m in sys.modules))",
+    )
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,106 @@
+"""Per-page illustration eval tolerates pages whose reply isn't JSON."""
+import json
+import os
+import types
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+GOOD = json.dumps([
+    {"category": "Text-Image Alignment", "score": "4", "justification": "ok"},
+    {"category": "Total Score", "score": "4", "justification": "sum"},
+])
+
+
+@pytest.fixture
+def evaluator(tmp_path, monkeypatch):
+    import cli
+
+    module = cli._load_script("unspecified_eval_k-2.py", "unspecified_eval_k2")
+    monkeypatch.setattr(module, "EVAL_PATH", str(tmp_path / "evaluations"))
+    monkeypatch.setattr(module, "VERBOSE", False)
+    return module
+
+
+@pytest.fixture
+def book(tmp_path):
+    images = tmp_path / "images"
+    images.mkdir()
+    for n in (1, 2):
+        (images / f"page_{n}.png").write_bytes(b"png-%d" % n)
+    story = tmp_path / "story.txt"
+    story.write_text("**Page 1**\nSam sat.\n**Page 2**\nThe cat ran.\n", encoding="utf-8")
+    return str(story), str(images)
+
+
+def fake_replies(monkeypatch, reply_for_page):
+    import llm_client
+
+    calls = []
+
+    def create_response(model, input, client=None, **kwargs):
+        text = input[1]["content"][0]["text"]
+        page = int(text.split("page ")[1].split(":")[0])
+        calls.append(page)
+        return types.SimpleNamespace(output_text=reply_for_page(page, calls.count(page)))
+
+    monkeypatch.setattr(llm_client, "create_response", create_response)
+    return calls
+
+
+def test_bad_page_is_retried_then_skipped(evaluator, book, monkeypatch):
+    calls = fake_replies(monkeypatch, lambda page, n: GOOD if page == 1 else "Sorry, I can't score this.")
+    book_rows = evaluator.eval_pages(None, *book)
+
+    assert sorted(calls) == [1, 2, 2]
+    assert book_rows[-1] == {"category": "Total Score", "score": "4.00",
+                             "justification": "Sum of per-category page means"}
+    with open(os.path.join(evaluator.EVAL_PATH, "story__page_evals.json"), encoding="utf-8") as f:
+        assert json.load(f)["2"] == {"error": "unparseable evaluation"}
+
+
+def test_retry_recovers_page(evaluator, book, monkeypatch):
+    calls = fake_replies(monkeypatch, lambda page, n: GOOD if page == 1 or n > 1 else "```json\n[{")
+    evaluator.eval_pages(None, *book)
+
+    assert sorted(calls) == [1, 2, 2]
+    with open(os.path.join(evaluator.EVAL_PATH, "story__page_evals.json"), encoding="utf-8") as f:
+        assert "error" not in json.dumps(json.load(f))
+
+
+def test_all_pages_failing_drops_stale_book_score(evaluator, book, monkeypatch):
+    stale = os.path.join(evaluator.EVAL_PATH, "story__image_eval.json")
+    os.makedirs(evaluator.EVAL_PATH)
+    with open(stale, "w", encoding="utf-8") as f:
+        f.write("[]")
+    fake_replies(monkeypatch, lambda page, n: "not json")
+
+    with pytest.raises(ValueError):
+        evaluator.eval_pages(None, *book)
+    assert not os.path.exists(stale)
+
+
+def test_story_without_page_headers_splits_on_rules(evaluator):
+    with open(os.path.join(ROOT, "alex-story-images-evaluation", "story.txt"), encoding="utf-8") as f:
+        pages = evaluator.split_story_pages(f.read())
+
+    assert sorted(pages) == [1, 2, 3, 4, 5, 6]  # page_1..6.png, title first
+    assert pages[1] == "**Title: The Clam and the Clan**"
+    assert pages[6].startswith("At the end of the day,")
+    assert "Mastered words" not in pages[6]
+
+
+def test_no_page_image_pairs_keeps_book_score(evaluator, book, tmp_path, monkeypatch):
+    existing = os.path.join(evaluator.EVAL_PATH, "story__image_eval.json")
+    os.makedirs(evaluator.EVAL_PATH)
+    with open(existing, "w", encoding="utf-8") as f:
+        f.write("[]")
+    calls = fake_replies(monkeypatch, lambda page, n: GOOD)
+    empty = tmp_path / "no_images"
+    empty.mkdir()
+
+    with pytest.raises(ValueError, match="No page/image pairs"):
+        evaluator.eval_pages(None, book[0], str(empty))
+    assert calls == []
+    assert os.path.exists(existing)
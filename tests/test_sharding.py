@@ -0,0 +1,72 @@
+"""Shard selection and merging back into the standard layout."""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import sharding
+from story_dedup import MinHashIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_every_job_lands_on_exactly_one_shard():
+    keys = [f"lesson:{n}" for n in range(200)]
+    owners = [[i for i in range(4) if sharding.in_shard(k, (i, 4))] for k in keys]
+    assert all(len(o) == 1 for o in owners)
+    assert sharding.select(keys, None) == keys
+
+
+@pytest.mark.parametrize("spec", ["4/4", "-1/4", "1/0", "1", "a/b"])
+def test_bad_shard_is_a_usage_error(spec):
+    result = subprocess.run(
+        [sys.executable, "cli.py", "generate", "student", "--shard", spec],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    assert result.returncode == 2
+    assert "argument --shard" in result.stderr and "Traceback" not in result.stderr
+
+
+def write_shard(output_dir, shard, key, text):
+    out = sharding.shard_dir(output_dir, shard)
+    story = os.path.join(out, f"{key}.txt")
+    os.makedirs(out, exist_ok=True)
+    with open(story, "w", encoding="utf-8") as f:
+        f.write(text)
+    MinHashIndex(path=os.path.join(out, "index.jsonl")).add(story, text, meta={"text_eval": text})
+    sharding.write_manifest(out, shard, [story], {key: {"score": 1}}, {"calls": 1})
+
+
+def index_keys(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line).get("key") for line in f if "key" in json.loads(line)]
+
+
+def test_merge_keeps_existing_index_records(tmp_path):
+    output_dir = str(tmp_path / "evaluations")
+    os.makedirs(output_dir)
+    existing = os.path.join(output_dir, "index.jsonl")
+    MinHashIndex(path=existing).add("/old/story.txt", "an old story about a cat", meta={"text_eval": "old"})
+
+    write_shard(output_dir, (0, 2), "a", "sam has a map and a hat")
+    write_shard(output_dir, (1, 2), "b", "the dog ran to the big red van")
+    merged = sharding.merge_shards(output_dir)
+
+    expected = ["/old/story.txt", os.path.join(output_dir, "a.txt"), os.path.join(output_dir, "b.txt")]
+    assert index_keys(existing) == expected
+    assert merged["stats"] == {"calls": 2}
+    assert MinHashIndex(path=existing).get_meta("/old/story.txt") == {"text_eval": "old"}
+
+    # Merging again replaces this merge's records instead of duplicating them
+    sharding.merge_shards(output_dir)
+    assert index_keys(existing) == expected
+
+
+def test_merge_refuses_missing_shards(tmp_path):
+    output_dir = str(tmp_path / "out")
+    write_shard(output_dir, (0, 3), "a", "sam has a map")
+    with pytest.raises(ValueError, match="Missing shards"):
+        sharding.merge_shards(output_dir)
+    assert sharding.merge_shards(output_dir, allow_partial=True)["missing"] == [1, 2]
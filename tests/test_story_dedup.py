@@ -0,0 +1,109 @@
+"""Near-duplicate index: rewritten files and evaluation reuse."""
+import itertools
+import random
+import string
+import types
+
+import pytest
+
+from story_dedup import MinHashIndex
+
+WORDS = ["".join(p) for p in itertools.product(string.ascii_lowercase, repeat=3)][:2000]
+
+
+def story(seed, length=120):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(length))
+
+
+def test_readding_key_replaces_signature(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    old, new = story(1), story(2)
+    index = MinHashIndex(path=path)
+    index.add("a.txt", old, meta={"score": 1})
+    index.add("a.txt", new)
+
+    for loaded in (index, MinHashIndex(path=path)):
+        assert loaded.find_duplicate(old) is None
+        assert loaded.find_duplicate(new) == ("a.txt", 1.0)
+        assert loaded.get_meta("a.txt") == {}
+        assert len(loaded) == 1
+
+
+def test_readding_same_text_merges_meta(tmp_path):
+    index = MinHashIndex(path=str(tmp_path / "index.jsonl"))
+    text = story(3)
+    index.add("a.txt", text, meta={"x": 1})
+    index.add("a.txt", text, meta={"y": 2})
+    assert index.get_meta("a.txt") == {"x": 1, "y": 2}
+
+
+@pytest.fixture
+def evaluator(tmp_path, monkeypatch):
+    import cli
+    import llm_client
+
+    module = cli._load_script("unspecified_eval_k-2.py", "unspecified_eval_k2")
+    monkeypatch.setattr(module, "EVAL_PATH", str(tmp_path / "evaluations"))
+    monkeypatch.setattr(module, "VERBOSE", False)
+    calls = []
+
+    def create_response(model, input, client=None, **kwargs):
+        calls.append(input[1]["content"])
+        return types.SimpleNamespace(output_text=f"eval {len(calls)}")
+
+    monkeypatch.setattr(llm_client, "create_response", create_response)
+    module.calls = calls
+    return module
+
+
+def test_edited_story_is_rescored(evaluator, tmp_path):
+    path = tmp_path / "story.txt"
+    text = story(4)
+    path.write_text(text, encoding="utf-8")
+    evaluator.eval_text(None, str(path))
+    evaluator.eval_text(None, str(path))
+    assert len(evaluator.calls) == 1  # unchanged text reuses its own result
+
+    # One word changed: still a near-duplicate of the stored entry
+    path.write_text(text.replace(text.split()[5], "zzz", 1), encoding="utf-8")
+    evaluator.eval_text(None, str(path))
+    assert len(evaluator.calls) == 2
+
+
+def test_near_duplicate_of_other_story_reuses(evaluator, tmp_path):
+    text = story(5)
+    (tmp_path / "a.txt").write_text(text, encoding="utf-8")
+    (tmp_path / "b.txt").write_text(text.replace(text.split()[5], "zzz", 1), encoding="utf-8")
+    evaluator.eval_text(None, str(tmp_path / "a.txt"))
+    evaluator.eval_text(None, str(tmp_path / "b.txt"))
+    assert len(evaluator.calls) == 1
+    assert (tmp_path / "evaluations" / "b__text_eval.json").read_text(encoding="utf-8") == "eval 1"
+
+
+def records(path):
+    with open(path, encoding="utf-8") as f:
+        return [line for line in f if '"key"' in line]
+
+
+def test_reevaluating_unchanged_story_appends_nothing(evaluator, tmp_path):
+    path = tmp_path / "story.txt"
+    path.write_text(story(6), encoding="utf-8")
+    for _ in range(5):
+        evaluator.eval_text(None, str(path))
+    assert len(records(tmp_path / "evaluations" / "text_eval_index.jsonl")) == 1
+
+
+def test_superseded_records_are_compacted_on_load(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    index = MinHashIndex(path=path)
+    index.add("a.txt", story(7), meta={"score": 1})
+    index.add("b.txt", story(8))
+    for n in range(4):
+        index.add("a.txt", story(7), meta={"score": n + 2})
+    assert len(records(path)) == 6
+
+    loaded = MinHashIndex(path=path)
+    assert len(records(path)) == 2
+    assert loaded.get_meta("a.txt") == {"score": 5}
+    assert MinHashIndex(path=path).find_duplicate(story(8)) == ("b.txt", 1.0)
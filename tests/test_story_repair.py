@@ -0,0 +1,66 @@
+"""Local repair must keep part of speech and meaning."""
+import pytest
+
+pytest.importorskip("lemminflect")
+pytest.importorskip("pronouncing")
+
+import story_repair  # noqa: E402
+
+needs_wordnet = pytest.mark.skipif(not story_repair.get_wordnet(), reason="WordNet corpus not installed")
+
+
+def repair(line, allowed, leftovers, names=()):
+    index = story_repair.build_substitution_index(set(allowed), set(), set())
+    return story_repair.repair_line(line, index, lambda w: w in leftovers, set(names))
+
+
+@needs_wordnet
+@pytest.mark.parametrize("line, allowed, leftover, expected", [
+    ("There was a chap named Chuck.", {"called", "fed", "tamed"}, "named",
+     "There was a chap called Chuck."),
+    ("Max tried to get the ball.", {"sought", "dried", "cried"}, "tried",
+     "Max sought to get the ball."),
+    ("Sam led the hike.", {"walk", "bike", "like"}, "hike",
+     "Sam led the walk."),
+])
+def test_swap_keeps_meaning(line, allowed, leftover, expected):
+    fixed, replacements, resolved = repair(line, allowed, {leftover}, {"chuck", "max", "sam"})
+    assert (fixed, resolved) == (expected, True)
+    assert len(replacements) == 1
+
+
+@needs_wordnet
+@pytest.mark.parametrize("line, allowed, leftover", [
+    # The closest-sounding allowed word means something else
+    ("Eve said, “Look at that!”", {"fed", "sad", "sat"}, "said"),
+    ("The boys ran to the van.", {"noise", "toys", "buoys"}, "boys"),
+    ("We can see the hill.", {"seem", "sea", "she"}, "see"),
+    ("I feel so glad.", {"full", "fell", "fill"}, "feel"),
+    ("The farm is big.", {"form", "firm", "harm"}, "farm"),
+    # A synonym exists, but "making up" is phrasal
+    ("Sam is making up a song.", {"doing", "baking"}, "making"),
+])
+def test_unrelated_sound_alike_goes_to_model(line, allowed, leftover):
+    assert repair(line, allowed, {leftover}, {"eve", "sam"}) == (line, [], False)
+
+
+def test_ambiguous_word_goes_to_model():
+    # "runs" may be a noun or a verb and "home" may be four things; neither
+    # is guessed, so the sentences are left for the model
+    for line in ("Mom runs fast to grab it.", "They plan to go home."):
+        assert repair(line, {"bugs", "ham", "fast", "grab"}, {"runs", "home"}, {"mom"}) == (line, [], False)
+
+
+def test_context_settles_tag():
+    assert story_repair.tag_in_context("runs", "he") == "VBZ"
+    assert story_repair.tag_in_context("runs", "the") == "NNS"
+    assert story_repair.tag_in_context("runs", None) is None
+    assert story_repair.tag_in_context("zorp", "the") is None
+
+
+def test_pronouns_are_not_names():
+    names = story_repair.find_names(["They ran.", "I sat with Pip.", "Then Pip hid."])
+    assert names == {"pip"}
+    assert story_repair.tag_in_context("run", "i", names) == "VB"
+    assert story_repair.tag_in_context("cut", "i", names) is None  # VB or VBD
+    assert story_repair.tag_in_context("runs", "pip", names) == "VBZ"
@@ -1,13 +1,15 @@
 import os
-import openpyxl
-from dotenv import load_dotenv
-from openai import OpenAI
 
-load_dotenv()
-client = OpenAI()
+import analysis
+import llm_client
+import sharding
+import story_dedup
+import story_repair
 
 OUTPUT_DIR = "generated_decodable_stories_two_phase"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+# Re-plan the story when it is a near-duplicate of one already written
+MAX_DIVERSITY_RETRIES = 2
 
 
 LESSON_FRY_LIMITS = {
@@ -51,53 +53,24 @@ def load_fry_words(filepath="Word Lists/1000words.txt", limit=100):
     return words[:limit]
 
 def load_phonics_lesson(filepath="phonics_lessons.xlsx", lesson_num=35):
-    wb = openpyxl.load_workbook(filepath)
-    ws = wb.worksheets[1]
-    row = ws[lesson_num + 1]
-    rule = row[0].value
-    words_raw = row[1].value
+    rule, words_raw = analysis.load_lesson_rows(filepath)[lesson_num]
     target_words = [w.strip().lower() for w in words_raw.split(",") if w.strip()]
     return rule, target_words
 
 def load_previous_phonics_words(filepath="phonics_lessons.xlsx", lesson_num=35):
-    wb = openpyxl.load_workbook(filepath)
-    ws = wb.worksheets[1]
-    review_words = set()
-    for ln in range(1, lesson_num):
-        row = ws[ln + 1]
-        words_raw = row[1].value
-        if words_raw:
-            review_words.update(w.strip().lower() for w in words_raw.split(",") if w.strip())
-    return list(review_words)
-
-
-def generate_story_outline(fry_words, review_words, target_words, phonics_class, grade, phase, sentence_range, target_repeat_guidance):
-    prompt = f"""
-Plan a short decodable story aligned to UFLI phonics lesson {phonics_class}.
-Include target words {target_words} with that specific phonics pattern naturally as much as possible
-The rest of the words should exclusively be from these sources: Fry words ({fry_words}) and previous phonics words ({review_words}).
-
-
-Story expectations:
-- Grade {grade}, {phase} of school year
-- Total story sentences: {sentence_range}
-- Target words repetition: {target_repeat_guidance}
-
-Structure:
-- Beginning: introduce characters and setting
-- Middle: simple problem, goal, or event
-- End: problem solved or goal achieved
-- Keep ONE main idea throughout
-- Each sentence should connect logically to the previous
-
-Page structure:
-- Kindergarten: ~1 sentence per page
-- Grade 1: ~2–3 sentences per page
-- Grade 2: ~4–5 sentences per page
-
-Each page should be separated with --- 
-
-Examples for tone and sentence structure:
+    review_words = analysis.load_previous_phonics_words(filepath, lesson_num)
+    # Sorted so the prompt text (and its cacheable prefix) is stable across runs
+    return sorted(review_words)
+
+
+# Static prompt content goes first (system message, then the per-lesson
+# context shared by the outline and story calls) so repeated requests share
+# a cacheable prefix; only the task text at the end varies per call.
+# Prompts are only cached past 1024 tokens. SYSTEM_PROMPT alone is ~350, so
+# nothing is shared between lessons; within a lesson the story call reuses
+# the outline call's prefix once the word lists take it past 1024 (lesson
+# 48 and later, ~1.3k-3k tokens, but not lesson 35 at ~900).
+EXAMPLE_STORIES = """
 Min has a kit.
 Kim has a lid.
 They dig in the big pit.
@@ -132,80 +105,112 @@ They ran past a big rock.
 At last, they sat and had a nap.
 Jan had fun.
 Sam had fun.
-
-Output a JSON array of short plot points (one per sentence).
 """
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
-    )
-    return response.choices[0].message.content.strip()
 
+SYSTEM_PROMPT = f"""
+You write short decodable stories for K–2 readers, aligned to UFLI phonics lessons.
 
-def generate_decodable_story(fry_words, review_words, target_words, outline_json, phonics_class, grade, phase, sentence_range, target_repeat_guidance):
-    prompt = f"""
-Write a short decodable story based on this outline: {outline_json}
+Structure:
+- Beginning: introduce characters and setting
+- Middle: simple problem, goal, or event
+- End: problem solved or goal achieved
+- Keep ONE main idea throughout
+- Each sentence should connect logically to the previous
+
+Page structure:
+- Kindergarten: ~1 sentence per page
+- Grade 1: ~2–3 sentences per page
+- Grade 2: ~4–5 sentences per page
 
 Rules:
-- Use ONLY words from these sources: Fry words ({fry_words}) and previous phonics words ({review_words})
-- Target words ({target_words}) must appear naturally {target_repeat_guidance}
-- Keep total sentences: {sentence_range}
-- Follow grade {grade}, {phase} page sentence guidelines
 - Each sentence should be short, simple, and decodable
-- Keep ONE main idea
 - Characters act consistently
 - No long, abstract, or multi-syllable words
-- Model tone and simplicity on these examples:
 
-Min has a kit.
-Kim has a lid.
-They dig in the big pit.
-“Dig, Min! Dig, Kim!”
-A bug is in the pit.
-The bug is big and red.
-Min can lift the lid.
-Kim can pin the bug in the kit.
-The bug will not slip.
-“Look, Kim! We did it!” said Min.
-Kim had a big grin.
-They put the bug in the kit.
-Min, Kim, and the bug sit in the sun.
-They had fun and did a big job.
+Examples for tone and sentence structure:
+{EXAMPLE_STORIES}"""
 
-Jan had a cat.
-The cat was Sam.
-Sam sat on Jan’s lap.
-Jan had a map.
-“It is a map of the park,” said Jan.
-“I can run and hop at the park!”
-Sam ran to the map.
-Sam sat on it.
-“Oh, Sam!” said Jan. “That is my map!”
-Jan got the map.
-Sam ran to the mat.
-Jan ran to Sam.
-“Let’s go, Sam!” said Jan.
-Jan and Sam ran and ran.
-They ran up a path.
-They ran past a big rock.
-At last, they sat and had a nap.
-Jan had fun.
-Sam had fun.
+
+def lesson_context(fry_words, review_words, target_words, phonics_class, grade, phase, sentence_range, target_repeat_guidance):
+    return f"""
+UFLI phonics lesson {phonics_class}
+Fry words: {fry_words}
+Previous phonics words: {review_words}
+Target words: {target_words}
+
+Story expectations:
+- Grade {grade}, {phase} of school year
+- Total story sentences: {sentence_range}
+- Target words repetition: {target_repeat_guidance}
+"""
+
+
+def build_messages(context, task):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": context},
+        {"role": "user", "content": task},
+    ]
+
+
+OUTLINE_TASK = """
+Plan a short decodable story for this lesson.
+Include the target words with that specific phonics pattern naturally as much as possible
+The rest of the words should exclusively be from the Fry words and previous phonics words.
+Each page should be separated with ---
+
+Output a JSON array of short plot points (one per sentence).
+"""
+
+
+def story_task(outline_json, grade, phase, sentence_range, target_repeat_guidance):
+    return f"""
+Write a short decodable story based on this outline: {outline_json}
+
+Rules:
+- Use ONLY words from the Fry words and previous phonics words
+- Target words must appear naturally {target_repeat_guidance}
+- Keep total sentences: {sentence_range}
+- Follow grade {grade}, {phase} page sentence guidelines
+- Model tone and simplicity on the examples
 
 Output the story as plain text, one sentence per line.
 """
-    response = client.chat.completions.create(
+
+
+def generate_story_outline(fry_words, review_words, target_words, phonics_class, grade, phase, sentence_range, target_repeat_guidance):
+    context = lesson_context(fry_words, review_words, target_words, phonics_class, grade, phase, sentence_range, target_repeat_guidance)
+    response = llm_client.chat_completion(
+        model="gpt-4o",
+        messages=build_messages(context, OUTLINE_TASK),
+    )
+    return response.choices[0].message.content.strip()
+
+
+def generate_decodable_story(fry_words, review_words, target_words, outline_json, phonics_class, grade, phase, sentence_range, target_repeat_guidance):
+    context = lesson_context(fry_words, review_words, target_words, phonics_class, grade, phase, sentence_range, target_repeat_guidance)
+    task = story_task(outline_json, grade, phase, sentence_range, target_repeat_guidance)
+    response = llm_client.chat_completion(
         model="gpt-4o",
-        messages=[{"role": "user", "content": prompt}],
+        messages=build_messages(context, task),
     )
     return response.choices[0].message.content.strip()
 
 
-def main():
-    lessons = [35, 48, 60, 80, 91, 120]
+DEFAULT_LESSONS = [35, 48, 60, 80, 91, 120]
+
+
+def main(lessons=None, shard=None):
+    lessons = sharding.select(lessons or DEFAULT_LESSONS, shard, key=lambda n: f"lesson:{n}")
+    output_dir = sharding.shard_dir(OUTPUT_DIR, shard)
+    os.makedirs(output_dir, exist_ok=True)
+    dedup_index = story_dedup.MinHashIndex(path=os.path.join(output_dir, "minhash_index.jsonl"))
+    outputs, metrics = [], {}
+    run_before = llm_client.stats()
 
     for lesson_num in lessons:
         print(f"Generating story for UFLI lesson {lesson_num}...")
+        usage_before = llm_client.stats()
 
         # Fry words
         fry_limit = LESSON_FRY_LIMITS.get(lesson_num, 40)
@@ -227,24 +232,60 @@ def main():
         sentence_range = STORY_EXPECTATIONS[(grade, phase)]["sentences"]
         target_repeat_guidance = STORY_EXPECTATIONS[(grade, phase)]["target_repeats"]
 
-        # outline
-        outline_json = generate_story_outline(
-            fry_words, review_words, target_words, lesson_num, grade, phase, sentence_range, target_repeat_guidance
+        story_dir = os.path.join(output_dir, f"Lesson_{lesson_num}")
+        story_path = os.path.join(story_dir, "story.txt")
+        for attempt in range(MAX_DIVERSITY_RETRIES + 1):
+            # outline
+            outline_json = generate_story_outline(
+                fry_words, review_words, target_words, lesson_num, grade, phase, sentence_range, target_repeat_guidance
+            )
+
+            # full story
+            story_text = generate_decodable_story(
+                fry_words, review_words, target_words, outline_json, lesson_num, grade, phase, sentence_range, target_repeat_guidance
+            )
+
+            duplicate = dedup_index.find_duplicate(story_text)
+            if duplicate is None or duplicate[0] == story_path or attempt == MAX_DIVERSITY_RETRIES:
+                break
+            print(f"Near-duplicate of {duplicate[0]} ({duplicate[1]:.2f}), re-planning")
+
+        # Local repair of leftover words; only unfixable sentences hit the model
+        story_text, repair_report = story_repair.repair_story(
+            story_text, lesson_num, fry_words, review_words, target_words
         )
-
-        # full story
-        story_text = generate_decodable_story(
-            fry_words, review_words, target_words, outline_json, lesson_num, grade, phase, sentence_range, target_repeat_guidance
+        print(
+            f"Repaired {len(repair_report['replacements'])} words locally, "
+            f"{len(repair_report['model_sentences'])} sentences sent to the model"
         )
+        for old, new in repair_report["replacements"]:
+            print(f"  {old} -> {new}")
 
         # Save story
-        story_dir = os.path.join(OUTPUT_DIR, f"Lesson_{lesson_num}")
         os.makedirs(story_dir, exist_ok=True)
-        with open(os.path.join(story_dir, "story.txt"), "w", encoding="utf-8") as f:
+        with open(story_path, "w", encoding="utf-8") as f:
             f.write(f"UFLI Lesson {lesson_num}: {rule}\n\n")
             f.write(story_text)
+        dedup_index.add(story_path, story_text)
 
+        usage = llm_client.stats()
+        prompt_tokens = usage["prompt_tokens"] - usage_before["prompt_tokens"]
+        cached_tokens = usage["cached_tokens"] - usage_before["cached_tokens"]
+        print(f"Prompt tokens: {prompt_tokens} ({cached_tokens} cached)")
         print(f"Saved story for lesson {lesson_num}\n")
+        outputs.append(story_path)
+        metrics[os.path.relpath(story_path, output_dir)] = {
+            "lesson": lesson_num,
+            "repairs": len(repair_report["replacements"]),
+            "model_sentences": len(repair_report["model_sentences"]),
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+        }
+
+    usage = llm_client.stats()
+    sharding.write_manifest(
+        output_dir, shard, outputs, metrics, {k: usage[k] - run_before[k] for k in usage}
+    )
 
 
 if __name__ == "__main__":
@@ -1,17 +1,40 @@
+from __future__ import annotations
+
 import os
+import re
 import json
 import base64
-from dotenv import load_dotenv
-from openai import OpenAI
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+import llm_client
+import sharding
+import story_dedup
+
+if TYPE_CHECKING:
+    from openai import OpenAI
 
 
 # Where evaluation results will be stored
 EVAL_PATH = "evaluations"
-os.makedirs(EVAL_PATH, exist_ok=True)
 
 
 VERBOSE = True
 
+# Concurrent per-page eval calls; llm_client still enforces the model limits
+PAGE_WORKERS = 4
+
+# Extra calls for a page whose reply isn't a rubric JSON array
+PAGE_PARSE_RETRIES = 1
+
+PAGE_HEADER = re.compile(r"^\W*page\s+(\d+)\W*$", re.IGNORECASE)
+
+# Near-duplicate stories reuse the text evaluation of their canonical story
+_dedup_lock = threading.Lock()
+_dedup_indexes = {}
+
 
 # Expanded rubrics (embedded directly into code)
 TEXT_RUBRIC = """
@@ -46,6 +69,9 @@ Scoring (strict):
 """
 
 
+# Each system prompt is ~250-280 tokens, under the 1024-token caching
+# minimum, so different stories share no cached prefix; log_usage shows
+# what each call actually got
 BASE_PROMPTS = {
 "text_eval": f"""
 You are an expert children's story editor. According to the rubric below, assess the quality of the given story text.
@@ -77,6 +103,23 @@ Return the response in this exact JSON format:
 ]
 Be strict. Use specific references to both text and images.
 """,
+
+
+"page_image_eval": f"""
+You are an expert children's story editor. According to the rubric below, assess ONE page of a story:
+the page text and its illustration. If a main character reference image is given, judge Consistency against it.
+Rubric:
+{IMAGE_RUBRIC}
+
+
+Return the response in this exact JSON format:
+[
+{{"category": "Alignment with Text", "score": "2", "justification": "..."}},
+...
+{{"category": "Total Score", "score": "12", "justification": "Overall evaluation of this page"}}
+]
+Be strict. Use specific references to both the page text and the image.
+""",
 }
 
 
@@ -99,46 +142,144 @@ def read_story_images(image_dir: str) -> dict[str, str]:
             with open(full_path, "rb") as f:
                 images[filename] = base64.b64encode(f.read()).decode("utf-8")
 
+    return images
+
+
+def split_story_pages(story_text: str) -> dict[int, str]:
+    """Map page number to page text for `**Page N**` / `Page N:` stories.
+
+    Stories without page headers are split on `---` instead; see
+    `split_story_blocks`.
+    """
+    pages = {}
+    current = None
+    for line in story_text.splitlines():
+        header = PAGE_HEADER.match(line.strip())
+        if header:
+            current = int(header.group(1))
+            pages[current] = []
+        elif current is not None and line.strip() and line.strip() != "---":
+            # "The End" or a trailing "Character description:"-style section closes the last page
+            if line.strip().strip("*").lower() == "the end" or line.strip().endswith(":"):
+                current = None
+                continue
+            pages[current].append(line.strip())
+    if not pages:
+        return split_story_blocks(story_text)
+    return {n: "\n".join(lines) for n, lines in pages.items()}
+
+
+def split_story_blocks(story_text: str) -> dict[int, str]:
+    """Number the `---`-separated blocks of a story from 1, title block included.
+
+    Books illustrated this way put the title on page_1.png. The first block
+    that opens with a `Heading:` line (word lists, character description)
+    ends the story.
+    """
+    pages = {}
+    for block in re.split(r"^\s*---\s*$", story_text, flags=re.MULTILINE):
+        lines = [line.strip() for line in block.splitlines() if line.strip()]
+        if not lines:
+            continue
+        if lines[0].endswith(":"):
+            break
+        pages[len(pages) + 1] = "\n".join(lines)
+    return pages
+
+
+def parse_eval_json(output_text: str) -> list[dict]:
+    """Parse rubric rows, tolerating a ```json fence around them."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", output_text.strip())
+    return json.loads(text)
+
+def log_usage(label: str, response) -> None:
+    """Print a call's prompt and cached-prompt tokens when VERBOSE."""
+    if VERBOSE:
+        prompt, cached, _ = llm_client.usage_counts(getattr(response, "usage", None))
+        print(f"{label}: {prompt} prompt tokens ({cached} cached)")
 
-        return images
 
-def eval_text(client: OpenAI, story_path: str):
-    story_text = read_story_from_file(story_path)
+def eval_name(story_path: str, root: str | None = None) -> str:
+    """Output file prefix: the file name, or the path under `root` joined by "__"."""
+    rel = os.path.relpath(story_path, root) if root else os.path.basename(story_path)
+    return os.path.splitext(rel)[0].replace(os.sep, "__")
 
-    prompt = (
-        f"This is your rubric:\n{TEXT_RUBRIC}\n"
-        f"This is the story you must evaluate:\n{story_text}"
-    )
 
-    response = client.responses.create(
-        model="gpt-4o-mini",
-        input=[
-            {"role": "system", "content": BASE_PROMPTS["text_eval"]},
-            {"role": "user", "content": prompt},
-        ],
-    )
+def text_eval_index() -> story_dedup.MinHashIndex:
+    """MinHash index of evaluated stories, stored alongside the evaluations."""
+    path = os.path.join(EVAL_PATH, "text_eval_index.jsonl")
+    if path not in _dedup_indexes:
+        _dedup_indexes[path] = story_dedup.MinHashIndex(path=path)
+    return _dedup_indexes[path]
 
-    eval_path = os.path.join(
-        EVAL_PATH, os.path.basename(story_path).replace(".txt", "__text_eval.json")
-    )
+
+def eval_text(client: OpenAI, story_path: str, name: str | None = None):
+    story_text = read_story_from_file(story_path)
+    key = os.path.abspath(story_path)
+    digest = hashlib.sha256(story_text.encode("utf-8")).hexdigest()
+
+    # Reuse this file's own evaluation only if its text is unchanged, and
+    # otherwise only another story's: an edited story must not match the
+    # stale entry for its own path
+    with _dedup_lock:
+        index = text_eval_index()
+        reused, source = None, None
+        own = index.get_meta(key)
+        if own.get("sha256") == digest and own.get("text_eval"):
+            reused, source = own["text_eval"], (key, 1.0)
+        else:
+            for match, sim in index.query(story_text):
+                if match == key:
+                    continue
+                # Entries written before every story kept its own copy point at their canonical
+                for candidate in (match, index.canonical_of(match)):
+                    if candidate != key and index.get_meta(candidate).get("text_eval"):
+                        reused, source = index.get_meta(candidate)["text_eval"], (candidate, sim)
+                        break
+                if reused:
+                    break
+
+    if reused:
+        output_text = reused
+        if VERBOSE:
+            print(f"Reusing text evaluation of {source[0]} (similarity {source[1]:.2f})")
+    else:
+        # The rubric is already in the system prompt; keep the user turn to the
+        # variable story text so every request shares the same cached prefix
+        prompt = f"This is the story you must evaluate:\n{story_text}"
+
+        response = llm_client.create_response(
+            model="gpt-4o-mini",
+            client=client,
+            input=[
+                {"role": "system", "content": BASE_PROMPTS["text_eval"]},
+                {"role": "user", "content": prompt},
+            ],
+        )
+        output_text = response.output_text
+        log_usage("Text evaluation", response)
+
+    with _dedup_lock:
+        index.add(key, story_text, meta={"text_eval": output_text, "sha256": digest})
+
+    os.makedirs(EVAL_PATH, exist_ok=True)
+    eval_path = os.path.join(EVAL_PATH, f"{name or eval_name(story_path)}__text_eval.json")
     with open(eval_path, "w", encoding="utf-8") as f:
-        f.write(response.output_text)
+        f.write(output_text)
 
     if VERBOSE:
         print(f"Saved text evaluation to {eval_path}")
+    return output_text
 
 
-def eval_images(client: OpenAI, story_path: str, image_dir: str):
+def eval_images(client: OpenAI, story_path: str, image_dir: str, name: str | None = None):
     if VERBOSE:
         print("- " * 80)
         print(f"Evaluating Images for {image_dir}\n")
 
     story_text = read_story_from_file(story_path)
 
-    prompt = (
-        f"This is your rubric:\n{IMAGE_RUBRIC}\n"
-        f"This is the story:\n{story_text}\n"
-    )
+    prompt = f"This is the story:\n{story_text}\n"
 
     story_images = read_story_images(image_dir)
     images_content = [
@@ -146,8 +287,9 @@ def eval_images(client: OpenAI, story_path: str, image_dir: str):
         for image in story_images.values()
     ]
 
-    response = client.responses.create(
+    response = llm_client.create_response(
         model="gpt-4o-mini",
+        client=client,
         input=[
             {"role": "system", "content": BASE_PROMPTS["image_eval"]},
             {
@@ -160,26 +302,251 @@ def eval_images(client: OpenAI, story_path: str, image_dir: str):
         ],
     )
 
-    eval_path = os.path.join(
-        EVAL_PATH, os.path.basename(story_path).replace(".txt", "__image_eval.json")
-    )
+    log_usage("Image evaluation", response)
+
+    os.makedirs(EVAL_PATH, exist_ok=True)
+    eval_path = os.path.join(EVAL_PATH, f"{name or eval_name(story_path)}__image_eval.json")
     with open(eval_path, "w", encoding="utf-8") as f:
         f.write(response.output_text)
 
     if VERBOSE:
         print(f"Saved image evaluation to {eval_path}")
+    return response.output_text
+
+
+def _page_unit_hash(page_text: str, image_bytes: bytes, reference_bytes: bytes | None) -> str:
+    digest = hashlib.sha256()
+    for part in (BASE_PROMPTS["page_image_eval"].encode("utf-8"), page_text.encode("utf-8"),
+                 image_bytes, reference_bytes or b""):
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def parse_page_rows(output_text: str) -> list[dict] | None:
+    """Rubric rows from a page reply, or None if it isn't a list of rows."""
+    try:
+        rows = parse_eval_json(output_text)
+    except ValueError:
+        return None
+    if not isinstance(rows, list) or not all(isinstance(r, dict) and "category" in r for r in rows):
+        return None
+    return rows
+
+
+def eval_page(client: OpenAI, page_num: int, page_text: str, image_path: str,
+              reference_path: str | None = None) -> tuple[list[dict] | None, bool]:
+    """Evaluate one page text + image pair, reusing a cached result by content hash.
+
+    Returns the rubric rows and whether they came from the cache. Rows are
+    None when the reply still isn't valid JSON after PAGE_PARSE_RETRIES.
+    """
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    reference_bytes = None
+    if reference_path:
+        with open(reference_path, "rb") as f:
+            reference_bytes = f.read()
+
+    cache_dir = os.path.join(EVAL_PATH, "page_cache")
+    cache_path = os.path.join(cache_dir, _page_unit_hash(page_text, image_bytes, reference_bytes) + ".json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f), True
+
+    content = [
+        {"type": "input_text", "text": f"This is page {page_num}:\n{page_text}\n"},
+        {"type": "input_image", "image_url": f"data:image/png;base64,{base64.b64encode(image_bytes).decode('utf-8')}"},
+    ]
+    if reference_bytes:
+        content += [
+            {"type": "input_text", "text": "Main character reference:"},
+            {"type": "input_image", "detail": "low",
+             "image_url": f"data:image/png;base64,{base64.b64encode(reference_bytes).decode('utf-8')}"},
+        ]
+
+    for _ in range(PAGE_PARSE_RETRIES + 1):
+        response = llm_client.create_response(
+            model="gpt-4o-mini",
+            client=client,
+            input=[
+                {"role": "system", "content": BASE_PROMPTS["page_image_eval"]},
+                {"role": "user", "content": content},
+            ],
+        )
+        log_usage(f"Page {page_num}", response)
+        rows = parse_page_rows(response.output_text)
+        if rows is not None:
+            break
+        if VERBOSE:
+            print(f"Page {page_num}: reply was not a rubric JSON array")
+    else:
+        return None, False
+
+    # Write then rename so concurrent readers never see a partial file
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2)
+    os.replace(tmp_path, cache_path)
+    return rows, False
+
+
+def aggregate_page_scores(page_results: dict[int, list[dict]]) -> list[dict]:
+    """Book-level rubric rows: the mean of each category over pages."""
+    scores = {}
+    for page_num, rows in sorted(page_results.items()):
+        for row in rows:
+            if row["category"] == "Total Score":
+                continue
+            try:
+                scores.setdefault(row["category"], []).append((float(row["score"]), page_num))
+            except (TypeError, ValueError):
+                continue
+
+    book = []
+    for category, values in scores.items():
+        mean = sum(v for v, _ in values) / len(values)
+        low, low_page = min(values)
+        book.append({
+            "category": category,
+            "score": f"{mean:.2f}",
+            "justification": f"Mean over {len(values)} pages; lowest {low:g} on page {low_page}.",
+        })
+    total = sum(float(row["score"]) for row in book)
+    book.append({"category": "Total Score", "score": f"{total:.2f}", "justification": "Sum of per-category page means"})
+    return book
+
+
+def eval_pages(client: OpenAI, story_path: str, image_dir: str, name: str | None = None):
+    """Evaluate each page's text with its page_N image and aggregate per book.
+
+    Unchanged pages are served from the cache, so regenerating one
+    illustration costs a single page-sized call.
+    """
+    if VERBOSE:
+        print("- " * 80)
+        print(f"Evaluating pages for {image_dir}\n")
+
+    pages = split_story_pages(read_story_from_file(story_path))
+    reference_path = os.path.join(image_dir, "main_character.png")
+    if not os.path.isfile(reference_path):
+        reference_path = None
+
+    units = {
+        n: (text, os.path.join(image_dir, f"page_{n}.png"))
+        for n, text in pages.items()
+        if os.path.isfile(os.path.join(image_dir, f"page_{n}.png"))
+    }
+    if not units:
+        # Nothing was evaluated, so an earlier book score stays as it is
+        raise ValueError(
+            f"No page/image pairs found: {len(pages)} pages in {story_path}, "
+            f"none with a matching page_N.png in {image_dir}"
+        )
+    with ThreadPoolExecutor(max_workers=PAGE_WORKERS) as pool:
+        futures = {
+            n: pool.submit(eval_page, client, n, text, image_path, reference_path)
+            for n, (text, image_path) in units.items()
+        }
+        results = {n: future.result() for n, future in futures.items()}
+
+    # Pages whose reply never parsed are recorded and left out of the book score
+    page_results = {n: rows for n, (rows, _) in results.items() if rows is not None}
+    failed = sorted(n for n, (rows, _) in results.items() if rows is None)
+    cached = sum(1 for _, hit in results.values() if hit)
+
+    os.makedirs(EVAL_PATH, exist_ok=True)
+    base = name or eval_name(story_path)
+    eval_path = os.path.join(EVAL_PATH, f"{base}__image_eval.json")
+    page_evals = {str(n): page_results.get(n, {"error": "unparseable evaluation"}) for n in sorted(results)}
+    with open(os.path.join(EVAL_PATH, f"{base}__page_evals.json"), "w", encoding="utf-8") as f:
+        json.dump(page_evals, f, indent=2)
+
+    if not page_results:
+        # Don't leave an earlier run's book score looking current
+        if os.path.exists(eval_path):
+            os.remove(eval_path)
+        raise ValueError(f"No page of {story_path} got a parseable evaluation")
+
+    book = aggregate_page_scores(page_results)
+    with open(eval_path, "w", encoding="utf-8") as f:
+        json.dump(book, f, indent=2)
 
-
-def main():
-    load_dotenv()
-    client = OpenAI()
+    if VERBOSE:
+        print(f"Evaluated {len(units)} pages ({cached} cached"
+              + (f", pages {failed} failed" if failed else "")
+              + f"); saved book scores to {eval_path}")
+    return book
+
+
+def _total_score(rows) -> float | None:
+    if isinstance(rows, str):
+        try:
+            rows = parse_eval_json(rows)
+        except ValueError:
+            return None
+    for row in rows or []:
+        if isinstance(row, dict) and row.get("category") == "Total Score":
+            try:
+                return float(row["score"])
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def eval_targets(client: OpenAI, targets: list[tuple[str, str | None]], shard=None,
+                 text: bool = True, single_request: bool = False):
+    """Evaluate the (story_path, image_dir) targets owned by `shard`.
+
+    Output names are the story paths relative to the targets' common folder,
+    so books that all use story.txt stay distinct and every shard agrees on
+    them. A sharded run writes under evaluations/_shards/shard_i_of_N/ with
+    a manifest; `sharding.merge_shards(EVAL_PATH)` folds shards back in.
+    """
+    global EVAL_PATH
+
+    paths = [story_path for story_path, _ in targets]
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths]) if len(paths) > 1 else None
+    base_path = EVAL_PATH
+    EVAL_PATH = sharding.shard_dir(base_path, shard)
+    outputs, metrics = [], {}
+    run_before = llm_client.stats()
+    try:
+        for story_path, image_dir in targets:
+            name = eval_name(os.path.abspath(story_path), root)
+            if not sharding.in_shard(f"eval:{name}", shard):
+                continue
+            scores = {"story": story_path}
+            if text:
+                scores["text_total"] = _total_score(eval_text(client, story_path, name))
+                outputs.append(os.path.join(EVAL_PATH, f"{name}__text_eval.json"))
+            if image_dir and single_request:
+                scores["image_total"] = _total_score(eval_images(client, story_path, image_dir, name))
+                outputs.append(os.path.join(EVAL_PATH, f"{name}__image_eval.json"))
+            elif image_dir:
+                scores["image_total"] = _total_score(eval_pages(client, story_path, image_dir, name))
+                outputs.append(os.path.join(EVAL_PATH, f"{name}__image_eval.json"))
+                outputs.append(os.path.join(EVAL_PATH, f"{name}__page_evals.json"))
+            metrics[name] = scores
+
+        usage = llm_client.stats()
+        sharding.write_manifest(
+            EVAL_PATH, shard, outputs, metrics, {k: usage[k] - run_before[k] for k in usage}
+        )
+    finally:
+        EVAL_PATH = base_path
+    return metrics
+
+
+def main(story_path=None, image_dir=None):
+    client = llm_client.get_client()
 
     # Update with your story + image paths
-    story_path = r"C:\Users\atn12\Downloads\unspecified_story\generated_book\story.txt"
-    image_dir = r"C:\Users\atn12\Downloads\unspecified_story\generated_book\images"
+    story_path = story_path or r"C:\Users\atn12\Downloads\unspecified_story\generated_book\story.txt"
+    image_dir = image_dir or r"C:\Users\atn12\Downloads\unspecified_story\generated_book\images"
 
     eval_text(client, story_path)
-    eval_images(client, story_path, image_dir)
+    eval_pages(client, story_path, image_dir)
 
 
 if __name__ == "__main__":